@@ -1,13 +1,24 @@
 import traceback
 import configparser
-from fastapi import APIRouter, Response, status, HTTPException
+from typing import Tuple
+from fastapi import APIRouter, Depends, Response, status, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from api.modules.modules import *
-from api.modules.handlers import dispatch
+from api.modules.nodes import node_types
 from api.modules.graph import GraphApp
+from api.modules.diff import diff_architectures
 from middleware.logging_middleware import logger
+from middleware.tracing import tracer
 from .routers import llms, inputs, outputs, chat, helpers
-from api.modules.graph import Graph, GraphNode
+from api.modules.runtime import RuntimeGraph
+from api.modules.validation import GraphValidator
+from api.modules.sessions import create_registry, session_id
+from api.modules.jobs import create_queue
+from api.modules.accounting import RunUsage, UsageTotals
+from api.modules.catalog import catalog
+from api.modules.lazy import gr
 
 addons = []
 try:
@@ -26,7 +37,7 @@ CSS = """
 
 router = APIRouter()
 
-graph_app = GraphApp(io=gr.Blocks(css=CSS))
+sessions = create_registry(lambda: GraphApp(io=gr.Blocks(css=CSS)))
 
 
 @router.get(
@@ -48,119 +59,302 @@ def get_integrations() -> AvailableIntegrations:
     return AvailableIntegrations(integrations=integrations)
 
 
+@router.get(
+    "/catalog",
+    summary="Get every node of the catalog",
+    response_description="Return every integration, option and node by endpoint",
+)
+def get_catalog() -> Dict[str, Any]:
+    """
+    ## Get every node of the catalog
+    Endpoint returning the responses of every integration, option and node
+    endpoint in a single document, keyed by their path (e.g. `/llms/openai`).
+    The catalog is rendered once on startup and served gzip compressed with an
+    ETag, so the builder palette loads with a single cacheable request.
+    Returns:
+    - Dict: Returns a JSON response with the catalog keyed by endpoint path
+    """
+    return catalog.documents
+
+
+def build_elements(
+    request_model: Dict[str, Any], graph_app: GraphApp
+) -> Dict[str, Any]:
+    """Create the Gradio elements of every node which has a type."""
+    elements = {
+        "chat_interface": None,
+        "input_elements": [],
+        "output_elements": [],
+        "data_elements": [],
+    }
+
+    for node in request_model["Nodes"]:
+        node_type = node_types.get(node)
+        if node_type is None:
+            logger.warning(
+                f"API | Update Architecture - No handler for node: {node['Name']}"
+            )
+        elif node_type.kind == "chat":
+            elements["chat_interface"] = node_type.handler(
+                node, elements["input_elements"], graph_app
+            )
+            elements["output_elements"] = None
+        elif node_type.kind == "input":
+            elements["input_elements"].append(node_type.handler(node))
+        elif node_type.kind == "output":
+            elements["output_elements"].append(node_type.handler(node))
+        else:
+            elements["data_elements"].append(node_type.handler(node))
+
+    if elements["chat_interface"] is None:
+        elements["input_elements"].insert(0, gr.Markdown("# Input"))
+        elements["output_elements"].insert(0, gr.Markdown("# Output"))
+
+    return elements
+
+
+def build_graph(request_model: Dict[str, Any]) -> RuntimeGraph:
+    """Build the runtime graph of every node which has a type and wire its edges."""
+    return RuntimeGraph.from_architecture(request_model, node_types.get)
+
+
+def load_architecture(request_model: Dict[str, Any]) -> GraphApp:
+    """Compile an architecture into a GraphApp without any Gradio interface."""
+    graph_app = GraphApp(io=None)
+    graph_app.graph = build_graph(request_model)
+    graph_app.plan = graph_app.graph.compile()
+    graph_app.stored_json = request_model
+    return graph_app
+
+
+jobs = create_queue(load_architecture)
+
+
 @router.post(
     "/update-architecture",
     summary="Update the current Gradio architecture",
     response_description="Success on if the JSON is valid for the architecture",
     response_model=None,
 )
-def update_architecture(architecture: ArchitectureContract) -> None:
+def update_architecture(
+    architecture: ArchitectureContract, session: str = Depends(session_id)
+) -> None:
     """
     ## Update the current Gradio architecture
     Endpoint to update the current Gradio architecture with the JSON provided.
+    Only the parts of the architecture which changed since the last update are
+    rebuilt: config-only edits patch the compiled plan in place, and the Gradio
+    interface is only re-rendered when a chat, input or output node changed.
+    Added or removed nodes and edges rebuild, validate and compile the whole
+    graph instead of being patched in, since they can introduce cycles and
+    change the execution order and slot layout of every step after them.
+    Every session, picked with the `X-Session-Id` header or `session` query
+    parameter, owns its own pipeline and Gradio interface, served at
+    /gradio/sessions/{session} (the default session is served at /gradio).
+    Rebuilt graphs are validated first, errors such as cycles are rejected with
+    a 400 and warnings such as disconnected nodes are returned as diagnostics.
     Returns:
-    - Dict: Returns a JSON response with the success status
+    - Dict: Returns a JSON response with the success status and any diagnostics
     """
 
-    request_model = architecture.model
-    if not request_model.get("Nodes") or not request_model.get("Edges"):
-        graph_app.render_elements()
-        return Response(status_code=status.HTTP_200_OK)
-    
-    if not graph_app.compare_json(request_model):
-        graph = Graph()
-        elements = {
-            "chat_interface": None,
-            "input_elements": [],
-            "output_elements": [],
-            "data_elements": [],
-        }
+    current = sessions.get(session)
+    graph_app = current.graph_app
+    with current.lock:
+        request_model = architecture.model
+        if not request_model.get("Nodes") or not request_model.get("Edges"):
+            graph_app.plan = None
+            graph_app.stored_json = None
+            graph_app.diagnostics = []
+            graph_app.render_elements()
+            return Response(status_code=status.HTTP_200_OK)
 
-        for node in request_model["Nodes"]:
-            name = node["Name"]
-            if "LLM" in node["Name"]:
-                name = "LLM"
-            handler = dispatch.get(name)
-            if handler:
-                element = (
-                    handler(node)
-                    if "Chat" not in name
-                    else handler(node, elements["input_elements"], graph_app)
+        with tracer.span("architecture.diff"):
+            diff = diff_architectures(graph_app.stored_json, request_model)
+        if diff.empty:
+            return Response(status_code=status.HTTP_200_OK)
+
+        if graph_app.plan is not None and not diff.structural:
+            nodes = {node["Id"]: node for node in request_model["Nodes"]}
+            args = {}
+            configs = {}
+            for idx in graph_app.graph.slots.keys() & set(diff.changed):
+                runtime_node = graph_app.graph.nodes[graph_app.graph.slots[idx]]
+                runtime_node.args = args[idx] = nodes[idx]["Items"]
+                runtime_node.config = configs[idx] = node_types.get(
+                    nodes[idx]
+                ).config.parse(args[idx])
+            with tracer.span("architecture.patch", nodes=len(args)):
+                plan = graph_app.plan.patch(args, configs)
+            logger.info(f"API | Update Architecture - Patched nodes: {diff.changed}")
+        else:
+            with tracer.span("architecture.build", nodes=len(request_model["Nodes"])):
+                graph = build_graph(request_model)
+            with tracer.span("architecture.validate"):
+                diagnostics = GraphValidator(graph).validate()
+            errors = [
+                item.model_dump() for item in diagnostics if item.level == "error"
+            ]
+            if errors:
+                logger.error(
+                    f"API | Update Architecture - Invalid architecture: {errors}"
                 )
-                graph.push(GraphNode(idx=node["Id"], name=node["Name"]))
-                if "Chat" in name:
-                    elements["chat_interface"] = element
-                    elements["input_elements"]
-                    elements["output_elements"] = None
-                elif "Input" in name:
-                    elements["input_elements"].append(element)
-                elif "Output" in name:
-                    elements["output_elements"].append(element)
-                else:
-                    elements["data_elements"].append(element)
-            else:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail=errors
+                )
+            for item in diagnostics:
                 logger.warning(
-                    f"API | Update Architecture - No handler for node: {node['Name']}"
+                    f"API | Update Architecture - {item.message}: {item.nodes}"
                 )
 
-        normal_edges = [
-            edge for edge in request_model["Edges"] if edge["Type"] == "Normal"
-        ]
-        data_edges = [
-            edge for edge in request_model["Edges"] if edge["Type"] == "Data"
-        ]
+            try:
+                with tracer.span("architecture.compile"):
+                    plan = graph.compile()
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+                )
+            graph_app.graph = graph
+            graph_app.diagnostics = diagnostics
+
+        graph_app.plan = plan
+        graph_app.memo = {
+            step.idx: graph_app.memo[step.idx]
+            for step in plan.steps
+            if step.idx in graph_app.memo and step.idx not in diff.changed
+        }
+        graph_app.stored_json = request_model
+        graph_app.usage = UsageTotals()
+        payload = json.dumps(request_model)
+        current.size = len(payload)
+        # The payload is not logged, its items hold the API keys of nodes.
+        logger.info(
+            "API | Update Architecture - Set model: %d nodes, %d edges (%d bytes)",
+            len(request_model["Nodes"]),
+            len(request_model["Edges"]),
+            current.size,
+        )
 
-        for edge in normal_edges:
-            source_id = int(edge["Source"])
-            target_id = int(edge["Target"])
+        if diff.ui:
+            with tracer.span("architecture.render"):
+                elements = build_elements(request_model, graph_app)
+                graph_app.render_elements(
+                    chat_interface=elements["chat_interface"],
+                    input_elements=elements["input_elements"],
+                    output_elements=elements["output_elements"],
+                )
 
-            target_json = request_model["Nodes"][target_id - 1]
-            func = graph_app.get_function(target_json)
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "diagnostics": [item.model_dump() for item in graph_app.diagnostics]
+            },
+        )
 
-            source_node = next((item for item in list(graph.node_index.keys()) if item.idx == source_id), None)
-            target_node = next((item for item in list(graph.node_index.keys()) if item.idx == target_id), None)
 
-            target_node.func = [func]
-            if graph.node_index[source_node] not in target_node.requires:
-                target_node.requires.append(graph.node_index[source_node])
-            target_node.args = target_json["Items"]
-            graph.connect(source_node, target_node)
+def compiled_app(session: str) -> GraphApp:
+    """The GraphApp of an existing session with an architecture. Unknown
+    sessions are not created, so headless requests never build a Gradio app
+    or evict other sessions."""
+    current = sessions.find(session)
+    if current is None or current.graph_app.plan is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="No architecture has been set for this session",
+        )
+    return current.graph_app
+
 
-        for edge in data_edges:
-            source_id = int(edge["Source"])
-            target_id = int(edge["Target"])
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
 
-            target_json = request_model["Nodes"][target_id - 1]
-            override = graph_app.get_override(target_json, edge["Target Handle"]) 
 
-            source_node = next((item for item in list(graph.node_index.keys()) if item.idx == source_id), None)
-            target_node = next((item for item in list(graph.node_index.keys()) if item.idx == target_id), None)
+async def stream_run(graph_app: GraphApp, args: Tuple[Any, ...]):
+    """Server-Sent-Events of a run: a `chunk` event for every partial value
+    of an output and a final `result` event with every output and the
+    accounting of the run, or an `error` event when the run fails."""
+    plan = graph_app.plan
+    targets = {}
+    for slot, origin in zip(plan.outputs, plan.output_origins):
+        targets.setdefault(origin, []).append(str(plan.ids[slot]))
+    if plan.chat is not None and len(plan.chat_origins) == 1:
+        targets.setdefault(plan.chat_origins[0], []).append(str(plan.ids[plan.chat]))
 
-            if graph.node_index[source_node] not in target_node.requires:
-                target_node.requires.append(graph.node_index[source_node])
-            if isinstance(target_node.overrides, list):
-                target_node.overrides.append(override)
+    usage = RunUsage()
+    try:
+        async for slot, value in graph_app.stream_plan(args, usage=usage):
+            if slot is None:
+                yield sse(
+                    "result",
+                    {"outputs": graph_app.outputs(plan, value), "usage": usage},
+                )
             else:
-                target_node.overrides = [override]
-            graph.connect(source_node, target_node)
+                for node in targets.get(slot, ()):
+                    yield sse("chunk", {"node": node, "value": value})
+    except Exception as e:
+        # The response has already started, so the failure is reported as an
+        # event rather than a status code.
+        logger.error(f"API | Run - Streamed run failed: {e}")
+        yield sse("error", {"detail": str(e)})
 
-            graph_app.graph = graph
-            graph_app.stored_json = request_model
-            logger.info(
-                f"API | Update Architecture - Set model: {json.dumps(request_model)}"
-            )
-        
-        if elements["chat_interface"] is None:
-            elements["input_elements"].insert(0, gr.Markdown("# Input"))
-            elements["output_elements"].insert(0, gr.Markdown("# Output"))
-
-        graph_app.render_elements(
-            chat_interface=elements["chat_interface"],
-            input_elements=elements["input_elements"],
-            output_elements=elements["output_elements"],
+
+@router.post(
+    "/run",
+    summary="Run the current architecture",
+    response_description="Return the outputs of the architecture keyed by node id",
+    response_model=RunResult,
+)
+async def run_architecture(
+    contract: RunContract, session: str = Depends(session_id)
+) -> RunResult:
+    """
+    ## Run the current architecture
+    Endpoint to run the architecture of a session directly, without going
+    through the Gradio interface. Inputs are keyed by input node id, chat
+    architectures take the chat message under the chat node id along with an
+    optional `history`. With `stream` set the response is a stream of
+    Server-Sent-Events instead.
+    Returns:
+    - RunResult: Returns a JSON response with the outputs keyed by output node id
+      and the time, tokens and estimated cost of every node
+    """
+    graph_app = compiled_app(session)
+
+    try:
+        args = graph_app.arguments(contract.inputs, contract.history)
+    except KeyError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.args[0])
+
+    if contract.stream:
+        return StreamingResponse(
+            stream_run(graph_app, args), media_type="text/event-stream"
         )
 
-    return Response(status_code=status.HTTP_200_OK)
+    plan = graph_app.plan
+    usage = RunUsage()
+    values = await graph_app.run_plan(args, usage=usage)
+    return RunResult(outputs=graph_app.outputs(plan, values), usage=usage)
+
+
+@router.get(
+    "/usage",
+    summary="Get the accounting of the current architecture",
+    response_description="Return the time, tokens and cost of every node summed over all runs",
+    response_model=UsageTotals,
+)
+def get_usage(session: str = Depends(session_id)) -> UsageTotals:
+    """
+    ## Get the accounting of the current architecture
+    Endpoint to get the wall time, queue wait, tokens and estimated cost of every
+    node, summed over every run since the architecture was last updated.
+    Returns:
+    - UsageTotals: Returns a JSON response with the totals per node and overall
+    """
+    current = sessions.find(session)
+    if current is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="No such session"
+        )
+    return current.graph_app.usage
 
 
 from .routers import llms, inputs, outputs, chat, helpers
@@ -171,6 +365,10 @@ router.include_router(llms.router, prefix="/llms", tags=["LLM Models"])
 router.include_router(helpers.router, prefix="/helpers", tags=["Helper Functions"])
 router.include_router(outputs.router, prefix="/outputs", tags=["Output Options"])
 
+from .routers import jobs as jobs_router
+
+router.include_router(jobs_router.router, prefix="/jobs", tags=["Jobs"])
+
 if "ROSIE" in addons:
     from .routers.addons import rosie
 
@@ -0,0 +1,104 @@
+import os
+import time
+import httpx
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Tuple
+
+if TYPE_CHECKING:
+    from api.models.openai import OpenAILLM
+    from api.models.ollama import OllamaLLM
+
+OPENAI_URL = "https://api.openai.com/v1"
+
+
+class ClientPool:
+    """Process-wide LRU cache of LLM clients, shared by every pipeline run.
+
+    Clients are keyed by provider, base URL, model, temperature and a hash of
+    the API key, so the key itself is never held in the cache index. Clients
+    which have not been used for `idle_timeout` seconds are dropped on the next
+    lookup. OpenAI clients share one keep-alive httpx connection pool per base
+    URL, so warm connections survive client eviction.
+    """
+
+    def __init__(self, max_size: int = 64, idle_timeout: float = 600):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.clients: OrderedDict[Tuple, Tuple[Any, float]] = OrderedDict()
+        self.http_clients: Dict[str, httpx.AsyncClient] = {}
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def digest(secret: str) -> str:
+        return hashlib.sha256(secret.encode()).hexdigest()[:16]
+
+    def get(self, key: Tuple, factory: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self.lock:
+            while self.clients:
+                oldest, (_, last_used) = next(iter(self.clients.items()))
+                if now - last_used < self.idle_timeout:
+                    break
+                self.clients.pop(oldest)
+
+            if key in self.clients:
+                client = self.clients.pop(key)[0]
+            else:
+                client = factory()
+                while len(self.clients) >= self.max_size:
+                    self.clients.popitem(last=False)
+
+            self.clients[key] = (client, now)
+            return client
+
+    def http_client(self, base_url: str) -> httpx.AsyncClient:
+        with self.lock:
+            if base_url not in self.http_clients:
+                self.http_clients[base_url] = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=100,
+                        max_keepalive_connections=20,
+                        keepalive_expiry=self.idle_timeout,
+                    ),
+                    timeout=httpx.Timeout(600, connect=10),
+                )
+            return self.http_clients[base_url]
+
+    def openai(self, api_key: str, model_type: str, temperature: float) -> "OpenAILLM":
+        # Providers are imported on first use, langchain is slow to import.
+        from api.models.openai import OpenAILLM
+
+        key = ("openai", OPENAI_URL, model_type, temperature, self.digest(api_key))
+        return self.get(
+            key,
+            lambda: OpenAILLM(
+                api_key=api_key,
+                model_type=model_type,
+                temperature=temperature,
+                http_async_client=self.http_client(OPENAI_URL),
+            ),
+        )
+
+    def ollama(
+        self, base_url: str, model_type: str, temperature: float, system: str
+    ) -> "OllamaLLM":
+        from api.models.ollama import OllamaLLM
+
+        key = ("ollama", base_url, model_type, temperature, self.digest(system))
+        return self.get(
+            key,
+            lambda: OllamaLLM(
+                base_url=base_url,
+                model_type=model_type,
+                temperature=temperature,
+                system=system,
+            ),
+        )
+
+
+client_pool = ClientPool(
+    max_size=int(os.getenv("CLIENT_POOL_SIZE", 64)),
+    idle_timeout=float(os.getenv("CLIENT_IDLE_TIMEOUT", 600)),
+)
@@ -1,8 +1,18 @@
 from pydantic import BaseModel
-from typing import Optional, List, Union
+from typing import Optional, List, Union, AsyncIterator
 from langchain_community.llms import Ollama
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 
+from api.modules.accounting import record_tokens
+from api.modules.conversation import (
+    token_counter,
+    history_messages,
+    is_chat,
+    message_text,
+    transcript,
+    window,
+)
+
 
 class OllamaLLM(BaseModel):
     base_url: str = "http://localhost:11434"
@@ -28,11 +38,47 @@ class OllamaLLM(BaseModel):
             base_url=base_url, system=system, model=model_type, temperature=temperature
         )
 
-    def invoke(self, data: str) -> AIMessage:
+    def prompt(self, data: str, history_tokens: int = 0) -> str:
+        history = []
         # Santize the input data
         if isinstance(data, list) or isinstance(data, tuple):
+            if is_chat(data):
+                history = data[1]
             data = data[0]
-        return self.model.invoke(data)
+
+        if not history or history_tokens <= 0:
+            return data
+
+        messages = window(
+            [],
+            history_messages(history),
+            HumanMessage(content=message_text(data)),
+            history_tokens,
+        )
+        return transcript(messages) + "\nAssistant:"
+
+    def invoke(self, data: str, history_tokens: int = 0) -> AIMessage:
+        return self.model.invoke(self.prompt(data, history_tokens))
+
+    async def ainvoke(self, data: str, history_tokens: int = 0) -> AIMessage:
+        return await self.model.ainvoke(self.prompt(data, history_tokens))
+
+    def astream(self, data: str, history_tokens: int = 0) -> AsyncIterator[str]:
+        return self.stream_prompt(self.prompt(data, history_tokens))
+
+    async def stream_prompt(self, prompt: str) -> AsyncIterator[str]:
+        """Stream the reply to a prompt built with `prompt`."""
+        text = ""
+        async for chunk in self.model.astream(prompt):
+            text += chunk
+            yield chunk
+
+        # Ollama's streamed text carries no usage, so both sides are estimated.
+        record_tokens(
+            self.model_type,
+            token_counter.count(message_text(self.system) + message_text(prompt)),
+            token_counter.count(text),
+        )
 
     class Config:
         protected_namespaces = ()
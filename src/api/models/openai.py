@@ -1,7 +1,11 @@
+import httpx
 from pydantic import BaseModel
 from langchain_openai import ChatOpenAI
-from typing import Optional, List, Union
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from typing import Optional, List, Union, AsyncIterator
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+
+from api.modules.accounting import record_tokens
+from api.modules.conversation import history_messages, is_chat, message_text, window
 
 
 class OpenAILLM(BaseModel):
@@ -19,12 +23,18 @@ class OpenAILLM(BaseModel):
         initial_cache: Optional[
             List[Union[SystemMessage, AIMessage, HumanMessage]]
         ] = None,
+        http_async_client: Optional[httpx.AsyncClient] = None,
     ):
         super().__init__(
             api_key=api_key, model_type=model_type, temperature=temperature
         )
         self.model = ChatOpenAI(
-            openai_api_key=api_key, model=model_type, temperature=temperature
+            openai_api_key=api_key,
+            model=model_type,
+            temperature=temperature,
+            http_async_client=http_async_client,
+            max_retries=0,
+            stream_usage=True,
         )
 
         if initial_cache is None:
@@ -38,7 +48,10 @@ class OpenAILLM(BaseModel):
         else:
             self.cache = initial_cache
 
-    def invoke(self, data: str) -> AIMessage:
+    def conversation(
+        self, data: str, history_tokens: int = 0
+    ) -> List[Union[HumanMessage, AIMessage, SystemMessage]]:
+        history = []
         # Santize the input data
         if isinstance(data, list) or isinstance(data, tuple):
             # Check to ensure that the first element is not an AIMessage
@@ -47,24 +60,60 @@ class OpenAILLM(BaseModel):
 
             # If list is a conversation, invoke the model
             if isinstance(data[0], SystemMessage) or isinstance(data[0], HumanMessage):
-                if len(data) > 1 and not isinstance(data[-1], HumanMessage):
-                    if isinstance(data[-1], tuple):
-                        data[-1] = HumanMessage(content=data[-1][0].strip())
-                    else:
-                        data[-1] = HumanMessage(content=data[-1].strip())
+                messages = list(data)
+                if len(messages) > 1 and not isinstance(messages[-1], HumanMessage):
+                    if is_chat(messages[-1]):
+                        history = messages[-1][1]
+                    prompt = messages.pop()
+                    if isinstance(prompt, tuple):
+                        prompt = prompt[0]
+                    messages.append(HumanMessage(content=message_text(prompt).strip()))
 
-                return self.model.invoke(data)
+                return window(
+                    messages[:-1],
+                    history_messages(history),
+                    messages[-1],
+                    history_tokens,
+                )
 
             # If the list is not any of the above, just take the first element
+            if is_chat(data):
+                history = data[1]
             prompt = data[0]
         elif isinstance(data, dict):
             prompt = data["text"]
         else:
             prompt = data
 
-        # Add the prompt to the cache and invoke the model
-        conversation = self.cache + [HumanMessage(content=prompt.strip())]
-        return self.model.invoke(conversation)
+        # Add the prompt to the cache
+        return window(
+            self.cache,
+            history_messages(history),
+            HumanMessage(content=message_text(prompt).strip()),
+            history_tokens,
+        )
+
+    def invoke(self, data: str, history_tokens: int = 0) -> AIMessage:
+        return self.model.invoke(self.conversation(data, history_tokens))
+
+    async def ainvoke(self, data: str, history_tokens: int = 0) -> AIMessage:
+        return await self.model.ainvoke(self.conversation(data, history_tokens))
+
+    def astream(self, data: str, history_tokens: int = 0) -> AsyncIterator[str]:
+        return self.stream_conversation(self.conversation(data, history_tokens))
+
+    async def stream_conversation(
+        self, conversation: List[BaseMessage]
+    ) -> AsyncIterator[str]:
+        """Stream the reply to a conversation built with `conversation`."""
+        async for chunk in self.model.astream(conversation):
+            if chunk.usage_metadata:
+                record_tokens(
+                    self.model_type,
+                    chunk.usage_metadata["input_tokens"],
+                    chunk.usage_metadata["output_tokens"],
+                )
+            yield chunk.content
 
     class Config:
         protected_namespaces = ()
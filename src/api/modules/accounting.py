@@ -0,0 +1,124 @@
+import time
+from contextvars import ContextVar
+from pydantic import BaseModel
+from typing import Dict, Optional, Tuple
+
+# USD per million (prompt, completion) tokens.
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+
+def price(model: str) -> Tuple[float, float]:
+    """Price of a model, matching dated snapshots to their base model."""
+    for name in sorted(PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return PRICES[name]
+    return (0.0, 0.0)
+
+
+class NodeUsage(BaseModel):
+    """Accounting of a single node in a single run."""
+
+    idx: int
+    name: str
+    wall_ms: float = 0
+    queue_ms: float = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0
+    reused: bool = False
+
+
+class RunUsage(BaseModel):
+    """Accounting of a single run, per node and in total."""
+
+    wall_ms: float = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0
+    nodes: Dict[str, NodeUsage] = {}
+
+    def node(self, idx: int, name: str) -> NodeUsage:
+        usage = self.nodes[str(idx)] = NodeUsage(idx=idx, name=name)
+        return usage
+
+    def finish(self, started: float) -> "RunUsage":
+        self.wall_ms = (time.perf_counter() - started) * 1000
+        for usage in self.nodes.values():
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+            self.cost += usage.cost
+        return self
+
+
+class NodeTotals(BaseModel):
+    """Accounting of a node summed over every run of an architecture."""
+
+    name: str
+    calls: int = 0
+    reused: int = 0
+    wall_ms: float = 0
+    queue_ms: float = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0
+
+
+class UsageTotals(BaseModel):
+    """Accounting of every run of an architecture since it was last updated."""
+
+    runs: int = 0
+    wall_ms: float = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0
+    nodes: Dict[str, NodeTotals] = {}
+
+    def add(self, run: RunUsage) -> None:
+        self.runs += 1
+        self.wall_ms += run.wall_ms
+        self.prompt_tokens += run.prompt_tokens
+        self.completion_tokens += run.completion_tokens
+        self.cost += run.cost
+        for idx, usage in run.nodes.items():
+            totals = self.nodes.get(idx)
+            if totals is None:
+                totals = self.nodes[idx] = NodeTotals(name=usage.name)
+            totals.calls += 1
+            totals.reused += usage.reused
+            totals.wall_ms += usage.wall_ms
+            totals.queue_ms += usage.queue_ms
+            totals.prompt_tokens += usage.prompt_tokens
+            totals.completion_tokens += usage.completion_tokens
+            totals.cost += usage.cost
+
+
+# The node being executed by the current task, so LLM clients can report
+# their usage without it being threaded through every call.
+current_usage: ContextVar[Optional[NodeUsage]] = ContextVar(
+    "current_usage", default=None
+)
+
+
+def record_tokens(model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    usage = current_usage.get()
+    if usage is None:
+        return
+
+    prompt_price, completion_price = price(model)
+    usage.prompt_tokens += prompt_tokens
+    usage.completion_tokens += completion_tokens
+    usage.cost += (
+        prompt_tokens * prompt_price + completion_tokens * completion_price
+    ) / 1e6
+
+
+def record_queue(seconds: float) -> None:
+    usage = current_usage.get()
+    if usage is not None:
+        usage.queue_ms += seconds * 1000
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from middleware.metrics import registry, hit_ratio
+
+
+def request_key(
+    provider: str,
+    backend: str,
+    model: str,
+    temperature: float,
+    system: str,
+    messages: List[Any],
+) -> str:
+    """Canonical hash of an LLM request, independent of message object identity.
+
+    `backend` identifies the endpoint and credentials serving the request, e.g.
+    its base URL and a digest of its API key, so requests made with different
+    keys are never answered by each other's calls or cached responses.
+    """
+    canonical = json.dumps(
+        {
+            "provider": provider,
+            "backend": backend,
+            "model": model,
+            "temperature": temperature,
+            "system": system,
+            "messages": [
+                (
+                    {"type": message.type, "content": message.content}
+                    if hasattr(message, "content")
+                    else message
+                )
+                for message in messages
+            ],
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def fingerprint(value: Any) -> str:
+    """Stable hash of a node value, covering Gradio payloads, arrays and messages."""
+    digest = hashlib.sha1()
+
+    def update(value: Any) -> None:
+        if isinstance(value, (list, tuple)):
+            digest.update(b"[")
+            for item in value:
+                update(item)
+            digest.update(b"]")
+        elif isinstance(value, dict):
+            digest.update(b"{")
+            for key in sorted(value, key=str):
+                update(key)
+                update(value[key])
+            digest.update(b"}")
+        elif hasattr(value, "tobytes"):
+            digest.update(str(getattr(value, "shape", "")).encode())
+            digest.update(value.tobytes())
+        elif hasattr(value, "type") and hasattr(value, "content"):
+            update((value.type, value.content))
+        else:
+            digest.update(type(value).__name__.encode())
+            digest.update(repr(value).encode())
+
+    update(value)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Two tier cache of LLM completions.
+
+    The first tier is an in-memory LRU, the optional second tier is a SQLite
+    table which survives restarts. Both tiers expire entries after `ttl`
+    seconds, and disk hits are promoted back into memory. The disk tier is
+    only used from a dedicated thread and drops expired rows every
+    `prune_every` writes.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float = 86400,
+        path: str = "",
+        prune_every: int = 256,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.writes = 0
+        self.memory: OrderedDict[str, tuple] = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "disk_hits": 0}
+        self.db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="cache"
+            )
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)"
+            )
+            self.db.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry is not None and entry[1] > now:
+            self.memory.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+        if self.db is not None:
+            row = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.read, key
+            )
+            if row is not None and row[1] > now:
+                self.remember(key, row[0], row[1])
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                return row[0]
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        expires = time.time() + self.ttl
+        self.remember(key, value, expires)
+        if self.db is not None:
+            self.writes += 1
+            prune = self.writes % self.prune_every == 0
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.write, key, value, expires, prune
+            )
+
+    def read(self, key: str) -> Optional[tuple]:
+        return self.db.execute(
+            "SELECT value, expires FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+
+    def write(self, key: str, value: str, expires: float, prune: bool) -> None:
+        if prune:
+            self.db.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, value, expires)
+        )
+        self.db.commit()
+
+    def remember(self, key: str, value: str, expires: float) -> None:
+        self.memory[key] = (value, expires)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    async def stream(self, key: str, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Replay a cached completion, or forward `chunks` and cache their text."""
+        cached = await self.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        text = ""
+        async for chunk in chunks:
+            text += chunk
+            yield chunk
+        await self.set(key, text)
+
+
+response_cache = ResponseCache(
+    max_size=int(os.getenv("RESPONSE_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", 86400)),
+    path=os.getenv("RESPONSE_CACHE_DB", ""),
+)
+
+registry.counter(
+    "llmflow_response_cache_requests_total",
+    "Response cache lookups by result, disk hits are also counted as hits.",
+    ("result",),
+    lambda: [((result,), count) for result, count in response_cache.stats.items()],
+)
+registry.gauge(
+    "llmflow_response_cache_hit_ratio",
+    "Share of response cache lookups served from the cache.",
+    collect=lambda: [
+        ((), hit_ratio(response_cache.stats["hits"], response_cache.stats["misses"]))
+    ],
+)
+registry.gauge(
+    "llmflow_response_cache_entries",
+    "Responses held in the in-memory tier of the cache.",
+    collect=lambda: [((), len(response_cache.memory))],
+)
@@ -0,0 +1,126 @@
+import os
+import gzip
+import json
+import asyncio
+import hashlib
+from typing import Any, Dict, Iterable
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+
+from api.modules.modules import AvailableIntegrations, AvailableOptions, Node
+from middleware.logging_middleware import logger
+
+CATALOG_MODELS = (AvailableIntegrations, AvailableOptions, Node)
+
+
+class CatalogEntry:
+    """A serialized catalog response, served as is with a strong ETag.
+
+    The identity and gzip bodies are different representations, so each has
+    its own ETag and either one is accepted when revalidating.
+    """
+
+    __slots__ = ("body", "gzipped", "etags", "headers", "gzip_headers")
+
+    def __init__(self, document: Any, max_age: int):
+        self.body = json.dumps(document, separators=(",", ":")).encode()
+        self.gzipped = gzip.compress(self.body, mtime=0)
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        etag, gzip_etag = f'"{digest}"', f'"{digest}-gzip"'
+        self.etags = {etag, gzip_etag}
+        common = [
+            (b"content-type", b"application/json"),
+            (b"cache-control", f"public, max-age={max_age}".encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        self.headers = common + [(b"etag", etag.encode())]
+        self.gzip_headers = common + [
+            (b"etag", gzip_etag.encode()),
+            (b"content-encoding", b"gzip"),
+        ]
+
+    async def __call__(self, scope, receive, send) -> None:
+        request_headers = dict(scope["headers"])
+        body, headers = self.body, self.headers
+        if b"gzip" in request_headers.get(b"accept-encoding", b""):
+            body, headers = self.gzipped, self.gzip_headers
+
+        matches = {
+            tag.strip().removeprefix("W/")
+            for tag in request_headers.get(b"if-none-match", b"").decode().split(",")
+        }
+        if matches & self.etags or "*" in matches:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": [
+                        header for header in headers if header[0] != b"content-encoding"
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": headers + [(b"content-length", str(len(body)).encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+class Catalog:
+    """Node catalog endpoints rendered once and served from memory.
+
+    Every GET route returning integrations, options or a node is called once
+    when the app starts and its route is pointed at the serialized response,
+    so requests skip building and serializing the pydantic models. The bulk
+    route serves every response in a single document, keyed by the path it is
+    served at relative to the API prefix.
+    """
+
+    def __init__(self, max_age: int = 300):
+        self.max_age = max_age
+        self.documents: Dict[str, Any] = {}
+        self.entries: Dict[str, CatalogEntry] = {}
+
+    def routes(self, routes: Iterable[Any]) -> Iterable[APIRoute]:
+        for route in routes:
+            if (
+                isinstance(route, APIRoute)
+                and "GET" in route.methods
+                and not route.param_convertors
+                and route.response_model in CATALOG_MODELS
+            ):
+                yield route
+
+    async def render(self, route: APIRoute) -> Any:
+        result = route.endpoint()
+        if asyncio.iscoroutine(result):
+            result = await result
+        return jsonable_encoder(result)
+
+    async def build(self, routes: Iterable[Any], prefix: str, bulk_path: str) -> None:
+        routes = list(routes)
+        catalog_routes = list(self.routes(routes))
+        documents = {}
+        for route in catalog_routes:
+            document = await self.render(route)
+            documents[route.path[len(prefix) :] or "/"] = document
+            route.app = self.entries[route.path] = CatalogEntry(document, self.max_age)
+
+        self.documents = documents
+        bulk = CatalogEntry(documents, self.max_age)
+        for route in routes:
+            if isinstance(route, APIRoute) and route.path == bulk_path:
+                route.app = self.entries[bulk_path] = bulk
+        logger.info(
+            f"API | Catalog - Rendered {len(documents)} endpoints, "
+            f"{len(bulk.body)} bytes ({len(bulk.gzipped)} compressed)"
+        )
+
+
+catalog = Catalog(max_age=int(os.getenv("CATALOG_MAX_AGE", 300)))
@@ -0,0 +1,118 @@
+import os
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from middleware.metrics import registry, hit_ratio
+
+
+class Flight:
+    """A provider call in progress and the chunks it produced so far."""
+
+    __slots__ = ("chunks", "done", "error", "changed", "subscribers", "task")
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """Coalesce identical concurrent LLM requests into one provider call.
+
+    The first caller for a request key starts the call, every caller arriving
+    while it is in flight subscribes to it, replaying the chunks produced so
+    far and then receiving new chunks as they stream in. Flights are dropped
+    as soon as they finish, so nothing is served after the call completes.
+    The call is cancelled if every subscriber goes away.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.flights: Dict[Tuple[int, str], Flight] = {}
+        self.stats: Dict[str, int] = {"calls": 0, "coalesced": 0}
+
+    async def produce(
+        self,
+        key: Tuple[int, str],
+        flight: Flight,
+        factory: Callable[[], AsyncIterator[str]],
+    ) -> None:
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except (Exception, asyncio.CancelledError) as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+            flight.notify()
+
+    async def stream(
+        self, key: str, factory: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """Stream the chunks of the flight for `key`, starting it with `factory`
+        if none is in progress."""
+        if not self.enabled:
+            async for chunk in factory():
+                yield chunk
+            return
+
+        key = (id(asyncio.get_running_loop()), key)
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = self.flights[key] = Flight()
+            flight.task = asyncio.create_task(self.produce(key, flight, factory))
+            self.stats["calls"] += 1
+        else:
+            self.stats["coalesced"] += 1
+
+        flight.subscribers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(flight.chunks):
+                    position += 1
+                    yield flight.chunks[position - 1]
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+                flight.task.cancel()
+
+
+single_flight = SingleFlight(
+    enabled=os.getenv("COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+)
+
+registry.counter(
+    "llmflow_coalesce_requests_total",
+    "LLM requests which started a provider call or joined one in flight.",
+    ("result",),
+    lambda: [((result,), count) for result, count in single_flight.stats.items()],
+)
+registry.gauge(
+    "llmflow_coalesce_hit_ratio",
+    "Share of LLM requests which joined a provider call in flight.",
+    collect=lambda: [
+        (
+            (),
+            hit_ratio(single_flight.stats["coalesced"], single_flight.stats["calls"]),
+        )
+    ],
+)
@@ -0,0 +1,103 @@
+import os
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import Any, Dict, FrozenSet, Iterable, Mapping
+
+from middleware.logging_middleware import logger
+
+
+class NodeConfig(BaseModel):
+    """Typed config of a node, parsed once from its `Items` when the
+    architecture is compiled. Fields are aliased to the item labels."""
+
+    class Config:
+        frozen = True
+        extra = "ignore"
+        populate_by_name = True
+        coerce_numbers_to_str = True
+
+    @classmethod
+    def parse(cls, items: Iterable[Dict[str, Any]]) -> "NodeConfig":
+        if not cls.model_fields:
+            return cls()
+        return cls.from_values({item.get("Type"): item.get("Value") for item in items})
+
+    @classmethod
+    def from_values(cls, values: Mapping[str, Any]) -> "NodeConfig":
+        """Validate item values by label, falling back to the default of every
+        field whose value is invalid."""
+        try:
+            return cls.model_validate(values)
+        except ValidationError as e:
+            values = dict(values)
+            for error in e.errors():
+                logger.warning(
+                    f"Model | Invalid {error['loc'][0]} for {cls.__name__}, using its default: {error['msg']}"
+                )
+                values.pop(error["loc"][0], None)
+            return cls.model_validate(values)
+
+    @classmethod
+    def secrets(cls) -> FrozenSet[str]:
+        """Item labels of the fields left out of the repr, which are never
+        logged."""
+        return frozenset(
+            field.alias or name
+            for name, field in cls.model_fields.items()
+            if not field.repr
+        )
+
+    def override(self, values: Mapping[str, Any]) -> "NodeConfig":
+        """Copy of the config with the values of some item labels replaced."""
+        return self.from_values({**self.model_dump(by_alias=True), **values})
+
+    @property
+    def memoized(self) -> bool:
+        """Whether a later run with the same inputs may reuse the result."""
+        return True
+
+
+def history_default() -> int:
+    return int(os.getenv("CHAT_HISTORY_TOKENS", 2048))
+
+
+class SystemPromptConfig(NodeConfig):
+    prompt: str = Field("", alias="Prompt")
+
+
+class LLMConfig(NodeConfig):
+    """Settings shared by LLM nodes."""
+
+    model: str = Field("", alias="Model")
+    temperature: float = Field(0.7, alias="Temperature")
+    cache: bool = Field(False, alias="Cache Responses")
+    history_tokens: int = Field(default_factory=history_default, alias="History Tokens")
+
+    @field_validator("cache", mode="before")
+    @classmethod
+    def checked(cls, value: Any) -> bool:
+        # Checkboxes report either a boolean or a list of checked options.
+        if isinstance(value, list):
+            return any(value)
+        return value is True or value in ("true", "True")
+
+    @field_validator("history_tokens", mode="before")
+    @classmethod
+    def whole(cls, value: Any) -> int:
+        return int(float(value))
+
+    @property
+    def memoized(self) -> bool:
+        # Completions are not deterministic, and those a node opts into
+        # caching are served by the response cache, which enforces its size
+        # and expiry.
+        return False
+
+
+class OpenAIConfig(LLMConfig):
+    api_key: str = Field("", alias="API Key", repr=False)
+    model: str = Field("gpt-4o-mini", alias="Model")
+
+
+class OllamaConfig(LLMConfig):
+    base_url: str = Field("", alias="Base URL")
+    system: str = Field("", alias="System Prompt")
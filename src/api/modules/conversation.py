@@ -0,0 +1,153 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Iterator, List
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from middleware.logging_middleware import logger
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Tokens every chat message costs on top of its content (role and separators).
+MESSAGE_OVERHEAD = 4
+
+
+def message_text(value: Any) -> str:
+    """Text of a Gradio chat message, which may be multimodal."""
+    if isinstance(value, dict):
+        return value.get("text", "")
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(item) for item in value)
+    return "" if value is None else str(value)
+
+
+def is_chat(value: Any) -> bool:
+    """Whether a value is the `(message, history, ...)` tuple of a chat node."""
+    return isinstance(value, tuple) and len(value) > 1 and isinstance(value[1], list)
+
+
+def history_messages(history: List[Any]) -> Iterator[BaseMessage]:
+    """Convert a Gradio chat history, in pairs or message dicts, to messages,
+    newest first, so only the part of a long history that is kept is converted.
+    """
+    for turn in reversed(history or []):
+        if isinstance(turn, dict):
+            kind = AIMessage if turn.get("role") == "assistant" else HumanMessage
+            yield kind(content=message_text(turn.get("content")))
+            continue
+
+        user, assistant = turn
+        if assistant is not None:
+            yield AIMessage(content=message_text(assistant))
+        if user is not None:
+            yield HumanMessage(content=message_text(user))
+
+
+class TokenCounter:
+    """Token counts of message contents, remembered so a growing chat history
+    only has its newest messages counted.
+
+    Uses tiktoken when it is installed and its encoding could be loaded, and
+    roughly four characters per token otherwise. The encoding may need to be
+    downloaded, so it is loaded on a background thread and counts are
+    estimated, and not remembered, until it is ready.
+    """
+
+    def __init__(self, encoding: str = "cl100k_base", max_size: int = 8192):
+        self.name = encoding
+        self.encoding = None
+        self.ready = tiktoken is None
+        self.loader = None
+        self.max_size = max_size
+        self.counts: OrderedDict[bytes, int] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self) -> None:
+        """Start loading the encoding, unless it is already loading."""
+        with self.lock:
+            if self.ready or self.loader is not None:
+                return
+            self.loader = threading.Thread(
+                target=self.download, name="tiktoken", daemon=True
+            )
+        self.loader.start()
+
+    def download(self) -> None:
+        try:
+            self.encoding = tiktoken.get_encoding(self.name)
+        except Exception as e:
+            logger.warning(
+                f"Model | Could not load the {self.name} encoding, estimating tokens: {e}"
+            )
+        self.ready = True
+
+    def count(self, text: str) -> int:
+        key = hashlib.sha1(text.encode()).digest()
+        with self.lock:
+            if key in self.counts:
+                self.counts.move_to_end(key)
+                return self.counts[key]
+
+        encoding = self.encoding
+        if encoding is not None:
+            count = len(encoding.encode(text, disallowed_special=()))
+        else:
+            count = (len(text) + 3) // 4
+            if not self.ready:
+                self.load()
+                return count
+
+        with self.lock:
+            self.counts[key] = count
+            while len(self.counts) > self.max_size:
+                self.counts.popitem(last=False)
+        return count
+
+    def message(self, message: BaseMessage) -> int:
+        return self.count(message_text(message.content)) + MESSAGE_OVERHEAD
+
+
+token_counter = TokenCounter()
+
+
+def window(
+    system: List[BaseMessage],
+    history: Iterable[BaseMessage],
+    prompt: BaseMessage,
+    budget: int,
+) -> List[BaseMessage]:
+    """Keep the newest messages of `history` (given newest first) which fit in
+    `budget` tokens next to the system messages and prompt, which are always
+    sent.
+
+    The window never starts with an assistant message, so every kept reply
+    comes with the message it answered.
+    """
+    if budget <= 0:
+        return system + [prompt]
+
+    used = token_counter.message(prompt) + sum(
+        token_counter.message(message) for message in system
+    )
+    kept = []
+    for message in history:
+        used += token_counter.message(message)
+        if used > budget:
+            break
+        kept.append(message)
+
+    while kept and isinstance(kept[-1], AIMessage):
+        kept.pop()
+    return system + kept[::-1] + [prompt]
+
+
+def transcript(messages: List[BaseMessage]) -> str:
+    """Render messages as a plain text prompt for completion models."""
+    roles = {"human": "User", "ai": "Assistant", "system": "System"}
+    return "\n".join(
+        f"{roles.get(message.type, message.type)}: {message_text(message.content)}"
+        for message in messages
+    )
@@ -0,0 +1,86 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.modules.nodes import node_types
+
+UI_KINDS = ("chat", "input", "output")
+
+
+def edge_key(edge: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    return (
+        str(edge["Source"]),
+        str(edge["Target"]),
+        edge["Type"],
+        str(edge.get("Target Handle", "")),
+    )
+
+
+class ArchitectureDiff(BaseModel):
+    """Structural difference between a stored architecture and a new one.
+
+    Nodes are matched by Id and compared on their Name and Items only, so
+    cosmetic fields sent by the builder do not count as changes. A node
+    whose Name changed is reported as removed and added. `ui` is set when a
+    touched node is a chat, input or output node according to its type.
+    """
+
+    added: List[int] = []
+    removed: List[int] = []
+    changed: List[int] = []
+    added_edges: List[Tuple[str, str, str, str]] = []
+    removed_edges: List[Tuple[str, str, str, str]] = []
+    ui: bool = False
+
+    @property
+    def structural(self) -> bool:
+        return bool(
+            self.added or self.removed or self.added_edges or self.removed_edges
+        )
+
+    @property
+    def empty(self) -> bool:
+        return not (self.structural or self.changed or self.ui)
+
+
+def kind(node: Dict[str, Any]) -> Optional[str]:
+    node_type = node_types.get(node)
+    return node_type.kind if node_type is not None else None
+
+
+def diff_architectures(
+    old: Optional[Dict[str, Any]], new: Dict[str, Any]
+) -> ArchitectureDiff:
+    new_nodes = {node["Id"]: node for node in new.get("Nodes", [])}
+    new_edges = {edge_key(edge) for edge in new.get("Edges", [])}
+    if old is None:
+        return ArchitectureDiff(
+            added=list(new_nodes), added_edges=sorted(new_edges), ui=True
+        )
+
+    old_nodes = {node["Id"]: node for node in old.get("Nodes", [])}
+    old_edges = {edge_key(edge) for edge in old.get("Edges", [])}
+
+    diff = ArchitectureDiff(
+        added_edges=sorted(new_edges - old_edges),
+        removed_edges=sorted(old_edges - new_edges),
+    )
+    touched = []
+    for idx, node in new_nodes.items():
+        previous = old_nodes.get(idx)
+        if previous is None or previous["Name"] != node["Name"]:
+            diff.added.append(idx)
+            touched.append(node)
+            if previous is not None:
+                diff.removed.append(idx)
+                touched.append(previous)
+        elif previous.get("Items") != node.get("Items"):
+            diff.changed.append(idx)
+            touched.append(node)
+
+    for idx, node in old_nodes.items():
+        if idx not in new_nodes:
+            diff.removed.append(idx)
+            touched.append(node)
+
+    diff.ui = any(kind(node) in UI_KINDS for node in touched)
+    return diff
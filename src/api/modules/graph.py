@@ -1,93 +1,62 @@
+import os
 import time
-import gradio as gr
-from typing import Dict, List, Union, ClassVar, Callable, Any, Optional
-from pydantic import BaseModel
-
-from api.models.openai import OpenAILLM
-from api.models.ollama import OllamaLLM
-from langchain_core.messages import SystemMessage
-from middleware.logging_middleware import logger
-
-
-class UnionFind:
-    """UnionFind data structure for graph validation"""
-
-    def __init__(self, n):
-        self.parent = list(range(n))
-        self.rank = [0] * n
-
-    def find(self, u):
-        if self.parent[u] != u:
-            self.parent[u] = self.find(self.parent[u])
-        return self.parent[u]
-
-    def union(self, u, v):
-        root_u = self.find(u)
-        root_v = self.find(v)
-        if root_u != root_v:
-            if self.rank[root_u] > self.rank[root_v]:
-                self.parent[root_v] = root_u
-            elif self.rank[root_u] < self.rank[root_v]:
-                self.parent[root_u] = root_v
-            else:
-                self.parent[root_v] = root_u
-                self.rank[root_u] += 1
-            return True
-        return False
-
-
-class GraphNode(BaseModel):
-    """A node in a list of nodes."""
-
-    idx: int
-    name: str
-    requires: List[int] = []
-    func: List[Callable] = []
-    args: List[Dict[str, Any]] = []
-    overrides: Optional[List[Dict[str, int]]] = None
-
-    def __hash__(self):
-        return hash((self.idx, self.name))
-
-
+import asyncio
+from collections import deque
+from typing import (
+    Dict,
+    List,
+    Tuple,
+    Callable,
+    Any,
+    Optional,
+    AsyncIterator,
+)
+from pydantic import BaseModel, Field
+
+from api.modules.lazy import gr
+from api.modules.runtime import (
+    PlanStep,
+    ExecutionPlan,
+    RuntimeGraph,
+)
+from api.modules.validation import Diagnostic
+from api.modules.cache import fingerprint
+from api.modules.accounting import NodeUsage, RunUsage, UsageTotals, current_usage
+from middleware.logging_middleware import (
+    logger,
+    Payload,
+    Secret,
+    sample_run,
+    sampled,
+)
+from middleware.metrics import registry
+from middleware.tracing import tracer
+
+node_duration = registry.histogram(
+    "llmflow_node_duration_seconds",
+    "Execution time of nodes by node type, memoized results excluded.",
+    ("node",),
+)
+node_runs = registry.counter(
+    "llmflow_node_runs_total",
+    "Node runs by node type and whether a memoized result was reused.",
+    ("node", "result"),
+)
 
-class Graph(BaseModel):
-    graph: Dict[GraphNode, GraphNode] = {}
-    node_index: Dict[GraphNode, int] = {}
-    index: int = 0
-    uf: ClassVar = UnionFind(1000)
-
-    def push(self, nodes: Union[GraphNode, List[GraphNode]]) -> None:
-        if not isinstance(nodes, list):
-            nodes = [nodes]
-
-        for node in nodes:
-            if node not in self.node_index:
-                self.node_index[node] = self.index
-                self.index += 1
-                self.graph[node] = []
-
-    def connect(self, u: GraphNode, v: GraphNode):
-        self.push([u, v])
-        union = self.uf.union(self.node_index[u], self.node_index[v])
-        if union:
-            self.graph[u].append(v.idx)
-            self.graph[v].append(u.idx)
-
-        return union
-    
 
 class GraphApp(BaseModel):
     io: Any
-    graph: Graph = Graph()
+    graph: Optional[RuntimeGraph] = None
+    plan: Optional[ExecutionPlan] = None
+    memo: Dict[int, Tuple[str, Any]] = {}
     stored_json: Optional[Dict[str, Any]] = None
+    diagnostics: List[Diagnostic] = []
+    usage: UsageTotals = Field(default_factory=UsageTotals)
+    max_parallelism: int = int(os.getenv("MAX_PARALLELISM", 4))
     ELEMENTS_PER_ROW: int = 4
 
-    def compare_json(self, json_data: Dict[str, Any]):
-        if self.stored_json == None:
-            return False
-
-        return self.stored_json == json_data
+    class Config:
+        arbitrary_types_allowed = True
 
     def render_elements(
         self,
@@ -98,14 +67,10 @@ class GraphApp(BaseModel):
         self.io.clear()
 
         if input_elements == None:
-            input_elements = [
-                gr.Markdown(
-                    """
+            input_elements = [gr.Markdown("""
                 # Welcome to LLMFlow!
                 Add some input and output nodes to see the magic happen!
-                """
-                )
-            ]
+                """)]
 
         if output_elements == None:
             output_elements = []
@@ -154,60 +119,278 @@ class GraphApp(BaseModel):
                                         ]:
                                             element.render()
 
-    def execute_model(self, *args):
-        data = args
-        for node in self.model:
-            for override in node.overrides:
-                ovrd_key = list(override.keys())[0]
-                ovrd_value = int(override[ovrd_key])
-                for dictionary in node.args:
-                    if "Type" in dictionary and dictionary["Type"] == ovrd_key:
-                        if isinstance(args[0], tuple):
-                            dictionary["Value"] = args[0][ovrd_value + 2]
-                            logger.info(
-                                f"Model | Set {ovrd_key} on node {node.name} to {args[0][ovrd_value + 2]}"
-                            )
-                        else:
-                            dictionary["Value"] = args[ovrd_value]
-                            logger.info(
-                                f"Model | Set {ovrd_key} on node {node.name} to {args[ovrd_value]}"
-                            )
-
-            final_result = []
-            for idx, func in enumerate(node.func):
-                temp_data = None
-                logger.info(f"Model | Executing {func.__name__} on node {node.name}")
-                logger.info(f"Model | Input data: {data}")
-                logger.info(f"Model | Input args: {node.args}")
-                start_time = time.time()
-                if isinstance(data, list) or isinstance(data, tuple):
-                    try:
-                        temp_data = func(data[idx], *node.args)
-                    except IndexError:
-                        temp_data = func(data[0], *node.args)
-                else:
-                    temp_data = func(data, *node.args)
+    async def run_step(
+        self,
+        step: PlanStep,
+        values: List[Any],
+        keys: List[Optional[str]],
+        emit: Optional[Callable[[int, str], None]] = None,
+        usage: Optional[NodeUsage] = None,
+    ) -> Any:
+        """Bind the overrides of a step for this run, resolve its input slots
+        and execute it with the bound config.
+
+        The key of a step hashes the keys of its input and override slots with
+        its bound args, so a step whose key matches its memoized run is not
+        executed again. Steps whose config is not memoized, such as LLMs whose
+        cached responses come from the response cache, always execute and are
+        keyed by their result instead. Streaming steps are drained into their full text,
+        reporting the text received so far to `emit` after every chunk. Other
+        steps report their result to `emit` once they finish. Timings and the
+        tokens reported by LLM clients are recorded into `usage`.
+        """
+        args, config = step.bind(values)
+        if step.overrides and sampled():
+            secrets = config.secrets()
+            for ovrd_key, source in step.overrides:
+                value = values[source]
                 logger.info(
-                    f"Model | Finished execution of {func.__name__} on node {node.name} - {time.time() - start_time}s"
+                    "Model | Set %s on node %s to %s",
+                    ovrd_key,
+                    step.name,
+                    Secret(value) if ovrd_key in secrets else Payload(value),
                 )
-                logger.info(f"Model | Function result: {temp_data}")
-
-                final_result.append(temp_data)
-
-            data = final_result
-            logger.info(f"Model | Node result: {data}")
-
-        if len(data) == 1:
-            return data[0]
-
-        return data
 
-    def execute_chat(self, *args):
-        if not self.model:
-            return "Chat interface is not connected to any output. Please loop the chat interface to reconnect to itself via other nodes or itself."
-
-        response = self.execute_model(args)
+        if len(step.inputs) == 1:
+            data = values[step.inputs[0]]
+        elif step.inputs:
+            data = [values[slot] for slot in step.inputs]
+        else:
+            data = None
+
+        keys[step.slot] = fingerprint(
+            (
+                tuple(keys[slot] for slot in step.inputs),
+                tuple(keys[source] for _, source in step.overrides),
+                args,
+            )
+        )
+        memo = self.memo.get(step.idx) if config.memoized else None
+        if memo is not None and memo[0] == keys[step.slot]:
+            logger.info("Model | Reusing result of node %s", step.name)
+            with tracer.span("node", node=step.name, idx=step.idx, reused=True):
+                pass
+            if usage is not None:
+                usage.reused = True
+            node_runs.inc(node=step.name, result="reused")
+            if emit is not None:
+                emit(step.slot, memo[1])
+            return memo[1]
+
+        logger.info("Model | Executing %s on node %s", step.func.__name__, step.name)
+        if sampled():
+            logger.info("Model | Input data: %s", Payload(data))
+            logger.info("Model | Input config: %s", Payload(config))
+        start_time = time.perf_counter()
+        token = current_usage.set(usage)
+        try:
+            with tracer.span("node", node=step.name, idx=step.idx):
+                if step.is_stream:
+                    result = ""
+                    async for chunk in step.func(data, config):
+                        result += chunk
+                        if emit is not None:
+                            emit(step.slot, result)
+                elif step.is_async:
+                    result = await step.func(data, config)
+                else:
+                    result = step.func(data, config)
+        finally:
+            current_usage.reset(token)
+            elapsed = time.perf_counter() - start_time
+            if usage is not None:
+                usage.wall_ms = elapsed * 1000
+            node_duration.observe(elapsed, node=step.name)
+            node_runs.inc(node=step.name, result="executed")
+
+        if emit is not None and not step.is_stream:
+            emit(step.slot, result)
+        logger.info(
+            "Model | Finished execution of %s on node %s - %.6fs",
+            step.func.__name__,
+            step.name,
+            elapsed,
+        )
+        if sampled():
+            logger.info("Model | Node result: %s", Payload(result))
+        if config.memoized:
+            self.memo[step.idx] = (keys[step.slot], result)
+        else:
+            # Steps downstream must not reuse results computed from a previous
+            # result of this step.
+            keys[step.slot] = fingerprint(result)
+        return result
 
+    async def run_plan(
+        self,
+        args: Tuple[Any, ...],
+        max_parallelism: Optional[int] = None,
+        emit: Optional[Callable[[int, str], None]] = None,
+        usage: Optional[RunUsage] = None,
+    ) -> List[Any]:
+        """Execute the compiled plan against the Gradio arguments and return every slot value.
+
+        Steps are scheduled as tasks on the running event loop as soon as every
+        step they require has finished, with at most `max_parallelism` of them
+        in flight for this run. Only steps downstream of a changed input or
+        config are executed, the rest reuse their memoized result. Per node
+        accounting is recorded into `usage` and added to the totals of the
+        architecture.
+        """
+        sample_run()
+        with tracer.span("run", steps=len(self.plan.steps)):
+            plan = self.plan
+            started = time.perf_counter()
+            usage = RunUsage() if usage is None else usage
+            values = [None] * plan.size
+            offset = 0
+            if plan.chat is not None:
+                values[plan.chat] = args
+                offset = 2
+
+            for position, slot in enumerate(plan.inputs):
+                if position + offset < len(args):
+                    values[slot] = args[position + offset]
+
+            keys = [None] * plan.size
+            for slot in plan.inputs + (() if plan.chat is None else (plan.chat,)):
+                keys[slot] = fingerprint(values[slot])
+
+            limit = max_parallelism or self.max_parallelism
+            if limit <= 1 or plan.width <= 1:
+                for step in plan.steps:
+                    values[step.slot] = await self.run_step(
+                        step, values, keys, emit, usage.node(step.idx, step.name)
+                    )
+                self.usage.add(usage.finish(started))
+                return values
+
+            waits = [step.waits for step in plan.steps]
+            ready = deque(
+                position for position, step in enumerate(plan.steps) if step.waits == 0
+            )
+            ready_at = {position: started for position in ready}
+            running = {}
+            try:
+                while ready or running:
+                    while ready and len(running) < limit:
+                        position = ready.popleft()
+                        step = plan.steps[position]
+                        node = usage.node(step.idx, step.name)
+                        node.queue_ms = (
+                            time.perf_counter() - ready_at[position]
+                        ) * 1000
+                        task = asyncio.create_task(
+                            self.run_step(step, values, keys, emit, node)
+                        )
+                        running[task] = position
+
+                    done, _ = await asyncio.wait(
+                        running, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        step = plan.steps[running.pop(task)]
+                        values[step.slot] = task.result()
+                        for dependent in step.dependents:
+                            waits[dependent] -= 1
+                            if waits[dependent] == 0:
+                                ready.append(dependent)
+                                ready_at[dependent] = time.perf_counter()
+            finally:
+                for task in running:
+                    task.cancel()
+
+            self.usage.add(usage.finish(started))
+            return values
+
+    async def stream_plan(
+        self,
+        args: Tuple[Any, ...],
+        max_parallelism: Optional[int] = None,
+        usage: Optional[RunUsage] = None,
+    ) -> AsyncIterator[Tuple[Optional[int], Any]]:
+        """Run the plan, yielding `(slot, value)` as chunks stream in and steps
+        finish, and finally `(None, values)` once every step has finished."""
+        queue = asyncio.Queue()
+        run = asyncio.create_task(
+            self.run_plan(
+                args,
+                max_parallelism,
+                emit=lambda slot, text: queue.put_nowait((slot, text)),
+                usage=usage,
+            )
+        )
+        run.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+            yield None, run.result()
+        finally:
+            run.cancel()
+
+    async def execute_model(self, *args):
+        if self.plan is None:
+            yield None
+            return
+
+        plan = self.plan
+        data = [gr.update()] * len(plan.outputs)
+        async for slot, value in self.stream_plan(args):
+            if slot is None:
+                data = [value[output] for output in plan.outputs]
+            elif slot in plan.output_origins:
+                for position, origin in enumerate(plan.output_origins):
+                    if origin == slot:
+                        data[position] = value
+            else:
+                continue
+
+            yield data[0] if len(data) == 1 else list(data)
+
+    async def execute_chat(self, *args):
+        if self.plan is None or not self.plan.chat_outputs:
+            yield "Chat interface is not connected to any output. Please loop the chat interface to reconnect to itself via other nodes or itself."
+            return
+
+        plan = self.plan
+        async for slot, value in self.stream_plan(args):
+            if slot is None:
+                response = [value[output] for output in plan.chat_outputs]
+                yield self.format_chat(response[0] if len(response) == 1 else response)
+            elif (
+                len(plan.chat_origins) == 1
+                and slot == plan.chat_origins[0]
+                and isinstance(value, str)
+            ):
+                yield value
+
+    def arguments(
+        self, inputs: Dict[str, Any], history: Optional[List[Any]] = None
+    ) -> Tuple[Any, ...]:
+        """Order a JSON map of values keyed by input node id as the Gradio
+        arguments of the plan. The chat node's value is the chat message."""
+        plan = self.plan
+        sources = plan.inputs + (() if plan.chat is None else (plan.chat,))
+        unknown = set(inputs) - {str(plan.ids[slot]) for slot in sources}
+        if unknown:
+            raise KeyError(f"Unknown input nodes: {sorted(unknown)}")
+
+        args = [inputs.get(str(plan.ids[slot])) for slot in plan.inputs]
+        if plan.chat is not None:
+            args = [inputs.get(str(plan.ids[plan.chat])), history or []] + args
+        return tuple(args)
+
+    def outputs(self, plan: ExecutionPlan, values: List[Any]) -> Dict[str, Any]:
+        """Map the output slots of a finished run to their node ids."""
+        outputs = {str(plan.ids[slot]): values[slot] for slot in plan.outputs}
+        if plan.chat is not None and plan.chat_outputs:
+            response = [values[slot] for slot in plan.chat_outputs]
+            outputs[str(plan.ids[plan.chat])] = self.format_chat(
+                response[0] if len(response) == 1 else response
+            )
+        return outputs
+
+    def format_chat(self, response: Any) -> str:
         if isinstance(response, tuple) and isinstance(response[0], dict):
             res = response[0].copy()
             response = ""
@@ -225,68 +408,3 @@ class GraphApp(BaseModel):
             if isinstance(response, list) or isinstance(response, tuple)
             else str(response)
         )
-
-    def get_function(self, node: Dict[str, Any]):
-        if node["Name"] == "System Prompt":
-
-            def function(data, *args):
-                return [SystemMessage(content=args[0]["Value"]), data]
-
-        elif node["Name"] == "OpenAI LLM":
-
-            def function(data, *args):
-                model = OpenAILLM(
-                    api_key=args[0]["Value"],
-                    model_type=args[1]["Value"],
-                    temperature=float(args[2]["Value"]),
-                )
-                return model.invoke(data).content
-
-        elif node["Name"] == "Ollama LLM":
-
-            def function(data, *args):
-                base_url = (
-                    "http://localhost:11434"
-                    if args[0]["Value"] == ""
-                    else args[0]["Value"]
-                )
-                system = ""
-
-                if len(data) >= 3 and isinstance(data[2], str):
-                    system = data[2]
-                else:
-                    system = (
-                        """You are an assistant developed by the LLMFlow framework. 
-                            LLMFlow is a no-code framework that allows anyone to build an LLM application with ease. 
-                            They can then take their generated programs to production with code generation and exportation to a Github repository."""
-                        if args[3]["Value"] == ""
-                        else args[3]["Value"]
-                    )
-                model = OllamaLLM(
-                    base_url=base_url,
-                    model_type=args[1]["Value"],
-                    temperature=float(args[2]["Value"]),
-                    system=system,
-                )
-                return model.invoke(data)
-
-        else:
-
-            def function(data, *args):
-                return data
-
-        return function
-
-    def get_override(self, node: Dict[str, Any], handle: str):
-        if node["Name"] == "OpenAI LLM":
-            if handle == "element_2":
-                return "API Key"
-            if handle == "element_3":
-                return "Model"
-            if handle == "element_4":
-                return "Temperature"
-
-        if node["Name"] == "System Prompt":
-            if handle == "element_1":
-                return "Prompt"
-
@@ -1,4 +1,4 @@
-import gradio as gr
+from api.modules.lazy import gr
 from api.modules.graph import GraphApp
 
 
@@ -92,17 +92,3 @@ def handle_llm(node):
 
 def handle_system_prompt(node):
     return gr.Textbox(visible=False, elem_id=node["Id"])
-
-
-dispatch = {
-    "Text-Only Chat": handle_text_only_chat,
-    "Multimodal Chat": handle_multimodal_chat,
-    "Text Input": handle_text_input,
-    "Image Input": handle_image_input,
-    "Audio Input": handle_audio_input,
-    "Video Input": handle_video_input,
-    "File Input": handle_file_input,
-    "Text Output": handle_text_output,
-    "LLM": handle_llm,
-    "System Prompt": handle_system_prompt,
-}
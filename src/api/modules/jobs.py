@@ -0,0 +1,348 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+from fastapi.encoders import jsonable_encoder
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from api.modules.graph import GraphApp
+from api.modules.accounting import RunUsage
+from middleware.logging_middleware import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session TEXT,
+    architecture TEXT,
+    total INTEGER,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job TEXT,
+    position INTEGER,
+    inputs TEXT,
+    history TEXT,
+    status TEXT DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    available REAL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (job, position)
+);
+CREATE INDEX IF NOT EXISTS pending_items ON items (status, available);
+"""
+
+
+class JobQueue:
+    """Durable queue of pipeline runs executed by a bounded pool of workers.
+
+    A job is a snapshot of an architecture plus one or more items, each item
+    being the inputs of a single run. Everything lives in SQLite, so items
+    which were running when the process stopped are picked up again on the
+    next start. The architecture snapshot, which may hold API keys, is dropped
+    once every item has finished, and finished jobs older than `retention`
+    seconds are deleted. Failed runs are retried with exponential backoff until they
+    have been attempted `max_attempts` times, items whose inputs do not fit the
+    architecture fail straight away.
+
+    The database is only used from a dedicated thread, so queries and commits
+    never block the event loop.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[Dict[str, Any]], GraphApp],
+        path: str = "data/jobs.db",
+        workers: int = 4,
+        max_attempts: int = 3,
+        poll_interval: float = 0.25,
+        retention: float = 7 * 24 * 3600,
+        prune_interval: float = 60,
+    ):
+        self.load = load
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.pruned = 0.0
+        self.apps: Dict[str, GraphApp] = {}
+        self.tasks: List[asyncio.Task] = []
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs")
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    async def call(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Run a database function on the database thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    def query(self, query: str, params: tuple = ()) -> List[tuple]:
+        return self.db.execute(query, params).fetchall()
+
+    def write(self, query: str, params: tuple = ()) -> None:
+        self.db.execute(query, params)
+        self.db.commit()
+
+    def insert(
+        self,
+        job: str,
+        session: str,
+        architecture: Dict[str, Any],
+        items: List[Dict[str, Any]],
+    ) -> None:
+        self.db.execute(
+            "INSERT INTO jobs VALUES (?, ?, ?, ?, ?)",
+            (job, session, json.dumps(architecture), len(items), time.time()),
+        )
+        self.db.executemany(
+            "INSERT INTO items (job, position, inputs, history) VALUES (?, ?, ?, ?)",
+            [
+                (
+                    job,
+                    position,
+                    json.dumps(item.get("inputs", {})),
+                    json.dumps(item.get("history", [])),
+                )
+                for position, item in enumerate(items)
+            ],
+        )
+        self.db.commit()
+
+    async def submit(
+        self, session: str, architecture: Dict[str, Any], items: List[Dict[str, Any]]
+    ) -> str:
+        """Store a job and its items, returning the job id."""
+        job = uuid.uuid4().hex
+        await self.call(self.insert, job, session, architecture, items)
+        logger.info(f"API | Jobs - Submitted job {job} with {len(items)} items")
+        return job
+
+    def progress(self, job: str) -> Optional[Dict[str, Any]]:
+        rows = self.query("SELECT total, created FROM jobs WHERE id = ?", (job,))
+        if not rows:
+            return None
+
+        counts = dict(
+            self.query(
+                "SELECT status, COUNT(*) FROM items WHERE job = ? GROUP BY status",
+                (job,),
+            )
+        )
+        total, created = rows[0]
+        finished = counts.get("done", 0) + counts.get("failed", 0)
+        return {
+            "id": job,
+            "status": "done" if finished == total else "running",
+            "total": total,
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "created": created,
+        }
+
+    async def status(self, job: str) -> Optional[Dict[str, Any]]:
+        return await self.call(self.progress, job)
+
+    def claim(self) -> Optional[tuple]:
+        """Mark the oldest available item as running and return it."""
+        row = self.db.execute(
+            "SELECT job, position, inputs, history, attempts FROM items "
+            "WHERE status = 'pending' AND available <= ? "
+            "ORDER BY rowid LIMIT 1",
+            (time.time(),),
+        ).fetchone()
+        if row is not None:
+            self.write(
+                "UPDATE items SET status = 'running', attempts = attempts + 1 "
+                "WHERE job = ? AND position = ?",
+                row[:2],
+            )
+        return row
+
+    async def app(self, job: str) -> GraphApp:
+        if job not in self.apps:
+            rows = await self.call(
+                self.query, "SELECT architecture FROM jobs WHERE id = ?", (job,)
+            )
+            self.apps[job] = self.load(json.loads(rows[0][0]))
+        return self.apps[job]
+
+    async def fail(
+        self, job: str, position: int, attempts: int, error: Exception, retry: bool
+    ) -> None:
+        logger.warning(
+            f"API | Jobs - Item {position} of job {job} failed (attempt {attempts}): {error}"
+        )
+        await self.call(
+            self.write,
+            "UPDATE items SET status = ?, available = ?, error = ? "
+            "WHERE job = ? AND position = ?",
+            (
+                "pending" if retry else "failed",
+                time.time() + 2**attempts,
+                str(error),
+                job,
+                position,
+            ),
+        )
+
+    async def process(self, row: tuple) -> None:
+        job, position, inputs, history, attempts = row
+        attempts += 1
+        try:
+            graph_app = await self.app(job)
+            plan = graph_app.plan
+            args = graph_app.arguments(json.loads(inputs), json.loads(history))
+        except Exception as e:
+            # The item does not fit its architecture snapshot, which retrying
+            # cannot change.
+            await self.fail(job, position, attempts, e, retry=False)
+        else:
+            try:
+                usage = RunUsage()
+                values = await graph_app.run_plan(args, usage=usage)
+                result = json.dumps(
+                    jsonable_encoder(
+                        {"outputs": graph_app.outputs(plan, values), "usage": usage}
+                    )
+                )
+            except asyncio.CancelledError:
+                await self.call(
+                    self.write,
+                    "UPDATE items SET status = 'pending', attempts = attempts - 1 "
+                    "WHERE job = ? AND position = ?",
+                    (job, position),
+                )
+                raise
+            except Exception as e:
+                await self.fail(
+                    job, position, attempts, e, attempts < self.max_attempts
+                )
+            else:
+                await self.call(
+                    self.write,
+                    "UPDATE items SET status = 'done', result = ?, error = NULL "
+                    "WHERE job = ? AND position = ?",
+                    (result, job, position),
+                )
+
+        if (await self.status(job))["status"] == "done":
+            self.apps.pop(job, None)
+            await self.call(
+                self.write, "UPDATE jobs SET architecture = NULL WHERE id = ?", (job,)
+            )
+
+    def prune(self) -> int:
+        """Delete finished jobs created more than `retention` seconds ago."""
+        expired = [
+            job
+            for (job,) in self.query(
+                "SELECT id FROM jobs WHERE created < ? AND NOT EXISTS ("
+                "SELECT 1 FROM items WHERE items.job = jobs.id "
+                "AND status IN ('pending', 'running'))",
+                (time.time() - self.retention,),
+            )
+        ]
+        for job in expired:
+            self.db.execute("DELETE FROM items WHERE job = ?", (job,))
+            self.db.execute("DELETE FROM jobs WHERE id = ?", (job,))
+        if expired:
+            self.db.commit()
+        return len(expired)
+
+    async def worker(self) -> None:
+        while True:
+            try:
+                row = await self.call(self.claim)
+                if row is None:
+                    if (
+                        self.retention
+                        and time.monotonic() - self.pruned > self.prune_interval
+                    ):
+                        self.pruned = time.monotonic()
+                        pruned = await self.call(self.prune)
+                        if pruned:
+                            logger.info(f"API | Jobs - Deleted {pruned} expired jobs")
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                await self.process(row)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A failing database must not shrink the pool, the item stays
+                # running until the next start requeues it.
+                logger.error(f"API | Jobs - Worker error: {e}", exc_info=True)
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        """Requeue items interrupted by a previous shutdown and start the workers."""
+        if self.tasks:
+            return
+
+        # The database thread runs the requeue before any claim of the workers.
+        self.executor.submit(
+            self.write, "UPDATE items SET status = 'pending' WHERE status = 'running'"
+        )
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        logger.info(f"API | Jobs - Started {self.workers} workers")
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def finished(self, job: str, position: int) -> Tuple[List[tuple], bool]:
+        """The finished items of a job from `position` up to its first
+        unfinished item, and whether every item of the job has finished."""
+        bound = self.db.execute(
+            "SELECT MIN(position) FROM items WHERE job = ? AND position >= ? "
+            "AND status IN ('pending', 'running')",
+            (job, position),
+        ).fetchone()[0]
+        query = (
+            "SELECT position, status, result, error FROM items "
+            "WHERE job = ? AND position >= ? AND status IN ('done', 'failed')"
+        )
+        params: tuple = (job, position)
+        if bound is not None:
+            query += " AND position < ?"
+            params += (bound,)
+        return self.query(query + " ORDER BY position", params), bound is None
+
+    async def results(self, job: str, follow: bool = True) -> AsyncIterator[str]:
+        """NDJSON lines of the finished items of a job in input order, waiting
+        for the remaining items while `follow` is set."""
+        position = 0
+        while True:
+            rows, complete = await self.call(self.finished, job, position)
+            for idx, status, result, error in rows:
+                line = {"position": idx, "status": status}
+                if status == "done":
+                    line.update(json.loads(result))
+                else:
+                    line["error"] = error
+                yield json.dumps(line) + "\n"
+                position = idx + 1
+
+            if not follow or complete:
+                return
+            await asyncio.sleep(self.poll_interval)
+
+
+def create_queue(load: Callable[[Dict[str, Any]], GraphApp]) -> JobQueue:
+    return JobQueue(
+        load,
+        path=os.getenv("JOBS_DB", "data/jobs.db"),
+        workers=int(os.getenv("JOB_WORKERS", 4)),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", 3)),
+        retention=float(os.getenv("JOB_RETENTION", 7 * 24 * 3600)),
+    )
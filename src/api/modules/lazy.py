@@ -0,0 +1,50 @@
+import time
+import importlib
+import threading
+from types import ModuleType
+from typing import Any, Iterable
+
+from middleware.logging_middleware import logger
+
+
+class LazyModule:
+    """Stand-in for a module, imported the first time one of its attributes is
+    used so heavy dependencies stay out of the startup path."""
+
+    __slots__ = ("name", "module")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.module = None
+
+    def load(self) -> ModuleType:
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return self.module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
+
+
+def preload(names: Iterable[str]) -> threading.Thread:
+    """Import modules on a background thread once the app is up, so the first
+    request using them does not pay for the import."""
+
+    def load():
+        for name in names:
+            start = time.perf_counter()
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                logger.warning(f"API | Preload - Could not import {name}: {e}")
+                continue
+            logger.info(
+                f"API | Preload - Imported {name} in {time.perf_counter() - start:.2f}s"
+            )
+
+    thread = threading.Thread(target=load, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+gr = LazyModule("gradio")
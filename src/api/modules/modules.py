@@ -1,8 +1,9 @@
 import json
-import gradio as gr
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Any, Union, Callable
 
+from api.modules.accounting import RunUsage
+
 
 class HealthCheck(BaseModel):
     """Response model to validate and return when performing a health check."""
@@ -36,6 +37,42 @@ class ArchitectureContract(BaseModel):
     model: Dict[str, Any]
 
 
+class RunContract(BaseModel):
+    """Contract model to run the current architecture without the Gradio interface."""
+
+    inputs: Dict[str, Any] = {}
+    history: List[Any] = []
+    stream: bool = False
+
+
+class RunResult(BaseModel):
+    """Response model with the outputs of a run, keyed by output node id, and
+    its accounting."""
+
+    outputs: Dict[str, Any] = {}
+    usage: Optional[RunUsage] = None
+
+
+class JobCreated(BaseModel):
+    """Response model with the id of a queued job."""
+
+    id: str
+    total: int
+
+
+class JobStatus(BaseModel):
+    """Response model with the progress of a queued job."""
+
+    id: str
+    status: str
+    total: int
+    pending: int = 0
+    running: int = 0
+    done: int = 0
+    failed: int = 0
+    created: float
+
+
 class NodeItem(BaseModel):
     """An element of the node object."""
 
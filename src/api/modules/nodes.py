@@ -0,0 +1,204 @@
+from pydantic import BaseModel
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Type
+from langchain_core.messages import SystemMessage
+
+from api.models.clients import OPENAI_URL, client_pool
+from api.modules import handlers
+from api.modules.runtime import passthrough
+from api.modules.cache import response_cache, request_key
+from api.modules.coalesce import single_flight
+from api.modules.traffic import Backend, traffic
+from api.modules.configs import (
+    NodeConfig,
+    SystemPromptConfig,
+    OpenAIConfig,
+    OllamaConfig,
+    LLMConfig,
+)
+from middleware.tracing import tracer
+
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_SYSTEM = """You are an assistant developed by the LLMFlow framework. 
+                            LLMFlow is a no-code framework that allows anyone to build an LLM application with ease. 
+                            They can then take their generated programs to production with code generation and exportation to a Github repository."""
+
+
+class NodeType(BaseModel):
+    """Everything the backend knows about a kind of node.
+
+    `kind` places the node in the pipeline: chat and input nodes are filled
+    from the Gradio arguments, every other node is a step, and output steps
+    are displayed. `handler` creates its Gradio element, `config` parses its
+    items, `executor` runs it with its input and parsed config, and
+    `overrides` maps the handles of data edges to the item they set.
+    """
+
+    name: str
+    kind: str = "step"
+    handler: Callable
+    config: Type[NodeConfig] = NodeConfig
+    executor: Callable = passthrough
+    overrides: Dict[str, str] = {}
+
+    class Config:
+        frozen = True
+
+    def override(self, handle: str) -> Optional[str]:
+        return self.overrides.get(handle)
+
+
+class NodeRegistry:
+    """Node types by name."""
+
+    def __init__(self):
+        self.types: Dict[str, NodeType] = {}
+
+    def register(self, node_type: NodeType) -> NodeType:
+        self.types[node_type.name] = node_type
+        return node_type
+
+    def get(self, node: Dict[str, Any]) -> Optional[NodeType]:
+        return self.types.get(node["Name"])
+
+
+def llm_request(
+    key: str,
+    backend: Backend,
+    chunks: Callable[[], AsyncIterator[str]],
+    prompt: Any,
+    config: LLMConfig,
+) -> AsyncIterator[str]:
+    """Stream an LLM request through the traffic limits of its backend and
+    the response cache, when the node enables it, coalescing it with
+    identical requests in flight."""
+
+    def call():
+        return traffic.stream(backend, chunks, len(str(prompt)) / 4)
+
+    if config.cache:
+        return single_flight.stream(
+            f"cache:{key}", lambda: response_cache.stream(key, call())
+        )
+    return single_flight.stream(key, call)
+
+
+def system_prompt(data: Any, config: SystemPromptConfig) -> list:
+    return [SystemMessage(content=config.prompt), data]
+
+
+async def openai_llm(data: Any, config: OpenAIConfig) -> AsyncIterator[str]:
+    with tracer.span("llm.client", provider="openai"):
+        model = client_pool.openai(
+            api_key=config.api_key,
+            model_type=config.model,
+            temperature=config.temperature,
+        )
+    with tracer.span("llm.prompt", provider="openai"):
+        conversation = model.conversation(data, config.history_tokens)
+        key = request_key(
+            "openai",
+            f"{OPENAI_URL}/{client_pool.digest(config.api_key)}",
+            model.model_type,
+            model.temperature,
+            "",
+            conversation,
+        )
+    backend = traffic.backend(
+        "openai", OPENAI_URL, client_pool.digest(config.api_key), model.model_type
+    )
+    async for chunk in llm_request(
+        key,
+        backend,
+        lambda: model.stream_conversation(conversation),
+        conversation,
+        config,
+    ):
+        yield chunk
+
+
+async def ollama_llm(data: Any, config: OllamaConfig) -> AsyncIterator[str]:
+    if len(data) >= 3 and isinstance(data[2], str):
+        system = data[2]
+    else:
+        system = config.system or OLLAMA_SYSTEM
+
+    with tracer.span("llm.client", provider="ollama"):
+        model = client_pool.ollama(
+            base_url=config.base_url or OLLAMA_URL,
+            model_type=config.model,
+            temperature=config.temperature,
+            system=system,
+        )
+    with tracer.span("llm.prompt", provider="ollama"):
+        prompt = model.prompt(data, config.history_tokens)
+        key = request_key(
+            "ollama",
+            model.base_url,
+            model.model_type,
+            model.temperature,
+            system,
+            [prompt],
+        )
+    backend = traffic.backend("ollama", model.base_url, model.model_type)
+    async for chunk in llm_request(
+        key,
+        backend,
+        lambda: model.stream_prompt(prompt),
+        prompt,
+        config,
+    ):
+        yield chunk
+
+
+node_types = NodeRegistry()
+
+for name, handler in (
+    ("Text-Only Chat", handlers.handle_text_only_chat),
+    ("Multimodal Chat", handlers.handle_multimodal_chat),
+):
+    node_types.register(NodeType(name=name, kind="chat", handler=handler))
+
+for name, handler in (
+    ("Text Input", handlers.handle_text_input),
+    ("Image Input", handlers.handle_image_input),
+    ("Audio Input", handlers.handle_audio_input),
+    ("Video Input", handlers.handle_video_input),
+    ("File Input", handlers.handle_file_input),
+):
+    node_types.register(NodeType(name=name, kind="input", handler=handler))
+
+node_types.register(
+    NodeType(name="Text Output", kind="output", handler=handlers.handle_text_output)
+)
+node_types.register(
+    NodeType(
+        name="System Prompt",
+        handler=handlers.handle_system_prompt,
+        config=SystemPromptConfig,
+        executor=system_prompt,
+        overrides={"element_1": "Prompt"},
+    )
+)
+node_types.register(
+    NodeType(
+        name="OpenAI LLM",
+        handler=handlers.handle_llm,
+        config=OpenAIConfig,
+        executor=openai_llm,
+        overrides={
+            "element_2": "API Key",
+            "element_3": "Model",
+            "element_4": "Temperature",
+        },
+    )
+)
+node_types.register(
+    NodeType(
+        name="Ollama LLM",
+        handler=handlers.handle_llm,
+        config=OllamaConfig,
+        executor=ollama_llm,
+    )
+)
+for name in ("Gemini LLM", "ROSIE LLM"):
+    node_types.register(NodeType(name=name, handler=handlers.handle_llm))
@@ -0,0 +1,372 @@
+import inspect
+from array import array
+from collections import deque
+from pydantic import BaseModel
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from api.modules.configs import NodeConfig
+from middleware.logging_middleware import logger
+
+
+def passthrough(data, *args):
+    """Default node function, forwards its input untouched."""
+    return data
+
+
+def override_positions(
+    args: Iterable[Dict[str, Any]], overrides: Iterable[Tuple[str, int]]
+) -> Tuple[Tuple[int, int], ...]:
+    """Resolve overrides by item label to `(arg position, source slot)` pairs."""
+    positions: Dict[Any, List[int]] = {}
+    for position, item in enumerate(args):
+        positions.setdefault(item.get("Type"), []).append(position)
+    return tuple(
+        (position, source)
+        for label, source in overrides
+        for position in positions.get(label, ())
+    )
+
+
+class PlanStep(BaseModel):
+    """A single precompiled node of an execution plan."""
+
+    idx: int
+    name: str
+    slot: int
+    level: int
+    func: Callable
+    is_async: bool = False
+    is_stream: bool = False
+    args: Tuple[Dict[str, Any], ...] = ()
+    config: NodeConfig = NodeConfig()
+    inputs: Tuple[int, ...] = ()
+    overrides: Tuple[Tuple[str, int], ...] = ()
+    override_args: Tuple[Tuple[int, int], ...] = ()
+    waits: int = 0
+    dependents: Tuple[int, ...] = ()
+
+    class Config:
+        frozen = True
+
+    def bind(self, values: List[Any]) -> Tuple[Tuple[Dict[str, Any], ...], NodeConfig]:
+        """Args and config of the step for one run, with the values of its data
+        edges applied. Overridden items are copied and the step is left
+        untouched, so concurrent runs never see each other's values."""
+        if not self.overrides:
+            return self.args, self.config
+        args = list(self.args)
+        for position, source in self.override_args:
+            args[position] = {**args[position], "Value": values[source]}
+        config = self.config.override(
+            {label: values[source] for label, source in self.overrides}
+        )
+        return tuple(args), config
+
+
+class ExecutionPlan(BaseModel):
+    """Immutable, topologically sorted form of a RuntimeGraph, built once per architecture.
+
+    Every node owns a slot in a flat value list, and `ids` maps slots back to
+    node ids. Input and chat nodes are filled from the Gradio arguments, every
+    other node is a step whose inputs are the slots of the nodes it requires. A step is ready once the
+    `waits` steps it depends on have finished, at which point it releases its
+    `dependents` (positions in `steps`).
+
+    Streaming steps forward their chunks through passthrough nodes, so the
+    origins map every output back to the slot whose chunks it displays.
+    """
+
+    size: int = 0
+    width: int = 0
+    ids: Tuple[int, ...] = ()
+    steps: Tuple[PlanStep, ...] = ()
+    levels: Tuple[Tuple[int, ...], ...] = ()
+    inputs: Tuple[int, ...] = ()
+    outputs: Tuple[int, ...] = ()
+    chat: Optional[int] = None
+    chat_outputs: Tuple[int, ...] = ()
+    output_origins: Tuple[int, ...] = ()
+    chat_origins: Tuple[int, ...] = ()
+
+    def patch(
+        self,
+        args: Dict[int, List[Dict[str, Any]]],
+        configs: Dict[int, NodeConfig],
+    ) -> "ExecutionPlan":
+        """Return a copy of the plan with new args and configs for the given
+        node ids.
+
+        The topology is unchanged, so every other step is shared with this plan.
+        """
+        steps = tuple(
+            (
+                step.model_copy(
+                    update={
+                        "args": tuple(dict(item) for item in args[step.idx]),
+                        "config": configs[step.idx],
+                        "override_args": override_positions(
+                            args[step.idx], step.overrides
+                        ),
+                    }
+                )
+                if step.idx in args
+                else step
+            )
+            for step in self.steps
+        )
+        return self.model_copy(update={"steps": steps})
+
+    class Config:
+        frozen = True
+
+
+class RuntimeNode:
+    """A compact node of a RuntimeGraph."""
+
+    __slots__ = ("idx", "name", "kind", "func", "args", "config", "overrides")
+
+    def __init__(
+        self,
+        idx: int,
+        name: str,
+        args: List[Dict[str, Any]],
+        func: Callable = passthrough,
+        kind: str = "step",
+        config: Optional[NodeConfig] = None,
+    ):
+        self.idx = idx
+        self.name = name
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.config = NodeConfig() if config is None else config
+        self.overrides: List[Tuple[str, int]] = []
+
+
+def csr(size: int, pairs: Iterable[Tuple[int, int]]) -> Tuple[array, array]:
+    """Pack `(target, source)` pairs into CSR arrays, dropping duplicates.
+
+    The sources of the node in slot `s` are `indices[indptr[s] : indptr[s + 1]]`,
+    in the order they were first seen.
+    """
+    seen = set()
+    unique = []
+    indptr = array("l", [0]) * (size + 1)
+    for pair in pairs:
+        if pair not in seen:
+            seen.add(pair)
+            unique.append(pair)
+            indptr[pair[0] + 1] += 1
+
+    for slot in range(size):
+        indptr[slot + 1] += indptr[slot]
+
+    indices = array("l", [0]) * len(unique)
+    fill = array("l", indptr[:-1])
+    for target, source in unique:
+        indices[fill[target]] = source
+        fill[target] += 1
+
+    return indptr, indices
+
+
+class RuntimeGraph:
+    """Indexed runtime form of an architecture, compiled into an ExecutionPlan.
+
+    Nodes live in a list indexed by slot with an id to slot map, and edges are
+    stored CSR-style in flat arrays: `inputs` holds the normal edges feeding
+    each node and `requires` every edge, data edges included, that the node
+    waits on.
+    """
+
+    __slots__ = (
+        "nodes",
+        "slots",
+        "input_indptr",
+        "inputs",
+        "require_indptr",
+        "requires",
+    )
+
+    def __init__(
+        self,
+        nodes: List[RuntimeNode],
+        inputs: Iterable[Tuple[int, int]],
+        requires: Iterable[Tuple[int, int]],
+    ):
+        self.nodes = nodes
+        self.slots = {node.idx: slot for slot, node in enumerate(nodes)}
+        self.input_indptr, self.inputs = csr(len(nodes), inputs)
+        self.require_indptr, self.requires = csr(len(nodes), requires)
+
+    @classmethod
+    def from_architecture(
+        cls,
+        request_model: Dict[str, Any],
+        node_type: Callable[[Dict[str, Any]], Optional[Any]],
+    ) -> "RuntimeGraph":
+        """Build the graph of an architecture payload in a single pass over its
+        nodes and edges, parsing the config of every node with its type.
+        Nodes without a type and the edges touching them are skipped."""
+        nodes = []
+        slots = {}
+        types = []
+        for node in request_model["Nodes"]:
+            spec = node_type(node)
+            if spec is not None:
+                slots[int(node["Id"])] = len(nodes)
+                nodes.append(
+                    RuntimeNode(
+                        node["Id"],
+                        node["Name"],
+                        node["Items"],
+                        kind=spec.kind,
+                        config=spec.config.parse(node["Items"]),
+                    )
+                )
+                types.append(spec)
+
+        inputs = []
+        requires = []
+        for edge in request_model["Edges"]:
+            source = slots.get(int(edge["Source"]))
+            target = slots.get(int(edge["Target"]))
+            if source is None or target is None:
+                logger.warning(
+                    f"API | Update Architecture - Skipping edge to unknown node: {edge['Source']} -> {edge['Target']}"
+                )
+                continue
+
+            node = nodes[target]
+            if edge["Type"] == "Normal":
+                node.func = types[target].executor
+                inputs.append((target, source))
+                requires.append((target, source))
+            elif edge["Type"] == "Data":
+                ovrd_key = types[target].override(edge["Target Handle"])
+                if ovrd_key is None:
+                    logger.warning(
+                        f"API | Update Architecture - No override for handle: {edge['Target Handle']}"
+                    )
+                    continue
+                node.overrides.append((ovrd_key, source))
+                requires.append((target, source))
+
+        return cls(nodes, inputs, requires)
+
+    def sources(self, slot: int) -> array:
+        return self.inputs[self.input_indptr[slot] : self.input_indptr[slot + 1]]
+
+    def requirements(self, slot: int) -> array:
+        return self.requires[self.require_indptr[slot] : self.require_indptr[slot + 1]]
+
+    def compile(self) -> ExecutionPlan:
+        """Sort the graph topologically and precompute the slots of every node."""
+        size = len(self.nodes)
+        chat = None
+        chat_outputs = ()
+        inputs = []
+        outputs = []
+        computed = []
+
+        for slot, node in enumerate(self.nodes):
+            if node.kind == "chat":
+                chat = slot
+                chat_outputs = tuple(self.sources(slot))
+            elif node.kind == "input":
+                inputs.append(slot)
+            else:
+                if node.kind == "output":
+                    outputs.append(slot)
+                computed.append(slot)
+
+        # Chat and input nodes are sources, edges looping back into them mark
+        # the end of the pipeline rather than a dependency.
+        indegree = array("l", [0]) * size
+        counts = array("l", [0]) * (size + 1)
+        for slot in computed:
+            indegree[slot] = self.require_indptr[slot + 1] - self.require_indptr[slot]
+            for source in self.requirements(slot):
+                counts[source + 1] += 1
+
+        for slot in range(size):
+            counts[slot + 1] += counts[slot]
+        dependents = array("l", [0]) * counts[size]
+        fill = array("l", counts[:-1])
+        for slot in computed:
+            for source in self.requirements(slot):
+                dependents[fill[source]] = slot
+                fill[source] += 1
+
+        level = array("l", [0]) * size
+        queue = deque(slot for slot in range(size) if indegree[slot] == 0)
+        visited = 0
+        while queue:
+            slot = queue.popleft()
+            visited += 1
+            for target in dependents[counts[slot] : counts[slot + 1]]:
+                level[target] = max(level[target], level[slot] + 1)
+                indegree[target] -= 1
+                if indegree[target] == 0:
+                    queue.append(target)
+
+        if visited != size:
+            raise ValueError(
+                "Architecture contains a cycle that does not pass through a chat node"
+            )
+
+        computed.sort(key=lambda slot: (level[slot], slot))
+        position_of = {slot: position for position, slot in enumerate(computed)}
+        steps = []
+        levels = {}
+        flags = {}
+        origin = list(range(size))
+        for position, slot in enumerate(computed):
+            node = self.nodes[slot]
+            sources = tuple(self.sources(slot))
+            if node.func is passthrough and len(sources) == 1:
+                origin[slot] = origin[sources[0]]
+            if node.func not in flags:
+                flags[node.func] = (
+                    inspect.iscoroutinefunction(node.func),
+                    inspect.isasyncgenfunction(node.func),
+                )
+
+            steps.append(
+                PlanStep.model_construct(
+                    idx=node.idx,
+                    name=node.name,
+                    slot=slot,
+                    level=level[slot],
+                    func=node.func,
+                    is_async=flags[node.func][0],
+                    is_stream=flags[node.func][1],
+                    args=tuple(dict(item) for item in node.args),
+                    config=node.config,
+                    inputs=sources,
+                    overrides=tuple(node.overrides),
+                    override_args=override_positions(node.args, node.overrides),
+                    waits=sum(
+                        source in position_of for source in self.requirements(slot)
+                    ),
+                    dependents=tuple(
+                        position_of[target]
+                        for target in dependents[counts[slot] : counts[slot + 1]]
+                    ),
+                )
+            )
+            levels.setdefault(level[slot], []).append(position)
+
+        return ExecutionPlan.model_construct(
+            size=size,
+            ids=tuple(node.idx for node in self.nodes),
+            width=max((len(group) for group in levels.values()), default=0),
+            steps=tuple(steps),
+            levels=tuple(tuple(levels[key]) for key in sorted(levels)),
+            inputs=tuple(inputs),
+            outputs=tuple(outputs),
+            chat=chat,
+            chat_outputs=chat_outputs,
+            output_origins=tuple(origin[slot] for slot in outputs),
+            chat_origins=tuple(origin[slot] for slot in chat_outputs),
+        )
@@ -0,0 +1,198 @@
+import os
+import re
+import sys
+import time
+import threading
+from fastapi import FastAPI, Header, Query, HTTPException, status
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+from api.modules.graph import GraphApp
+from api.modules.lazy import gr
+from middleware.logging_middleware import logger
+from middleware.metrics import registry
+
+DEFAULT_SESSION = "default"
+SESSION_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def session_id(
+    x_session_id: Optional[str] = Header(None),
+    session: Optional[str] = Query(None),
+) -> str:
+    """Resolve the session of a request from its `X-Session-Id` header or
+    `session` query parameter, falling back to the default session."""
+    value = x_session_id or session or DEFAULT_SESSION
+    if not SESSION_PATTERN.match(value):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Session ids may only contain letters, digits, '-' and '_' (max 64)",
+        )
+    return value
+
+
+class Session:
+    """A GraphApp owned by a single session or workspace."""
+
+    __slots__ = ("id", "graph_app", "lock", "last_used", "size", "asgi")
+
+    def __init__(self, id: str, graph_app: GraphApp):
+        self.id = id
+        self.graph_app = graph_app
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.size = 0
+        self.asgi = None
+
+    def footprint(self) -> int:
+        """Approximate bytes held by the session: its architecture payload plus
+        its memoized node results."""
+        return self.size + sum(
+            sys.getsizeof(value) for _, value in self.graph_app.memo.values()
+        )
+
+    def close(self) -> None:
+        if self.asgi is not None:
+            self.graph_app.io.close(verbose=False)
+
+
+class SessionRegistry:
+    """LRU registry holding one compiled pipeline per session.
+
+    Sessions are created on first use and dropped once they have been idle for
+    `idle_timeout` seconds, when more than `max_size` exist, or while the
+    sessions together hold more than `max_memory` bytes, least recently used
+    first. The default session backs the UI mounted at /gradio and is never
+    evicted. The registry lock only guards the index, each session has its own
+    lock so builders never wait on each other.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], GraphApp],
+        max_size: int = 64,
+        idle_timeout: float = 3600,
+        max_memory: int = 256 * 2**20,
+    ):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_memory = max_memory
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self.sessions
+
+    def get(self, session_id: str) -> Session:
+        now = time.monotonic()
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, self.factory())
+                session.graph_app.render_elements()
+                self.sessions[session_id] = session
+                logger.info(f"API | Sessions - Created session: {session_id}")
+
+            session.last_used = now
+            self.sessions.move_to_end(session_id)
+            self.prune(now)
+            return session
+
+    def find(self, session_id: str) -> Optional[Session]:
+        """The session if it exists, without creating it, so lookups for
+        unknown ids can not evict the sessions of other users."""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def evict(self, session_id: str) -> None:
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+            logger.info(f"API | Sessions - Evicted session: {session_id}")
+
+    def prune(self, now: float) -> None:
+        expired = [
+            session.id
+            for session in self.sessions.values()
+            if session.id != DEFAULT_SESSION
+            and now - session.last_used >= self.idle_timeout
+        ]
+        for idx in expired:
+            self.evict(idx)
+
+        # The most recently used session is kept even if it is over the cap.
+        candidates = [idx for idx in self.sessions if idx != DEFAULT_SESSION][:-1]
+        total = sum(session.footprint() for session in self.sessions.values())
+        while candidates and (
+            len(self.sessions) > self.max_size or total > self.max_memory
+        ):
+            idx = candidates.pop(0)
+            total -= self.sessions[idx].footprint()
+            self.evict(idx)
+
+    def asgi(self, session: Session) -> Any:
+        """The Gradio app of a session, mounted on first request."""
+        with self.lock:
+            if session.asgi is None:
+                session.asgi = gr.mount_gradio_app(
+                    FastAPI(), session.graph_app.io, path=""
+                )
+                session.graph_app.io.startup_events()
+            return session.asgi
+
+    async def __call__(self, scope, receive, send) -> None:
+        """Serve the Gradio interface of the session named in the mount path,
+        or of the default session when mounted without one. Other sessions are
+        only served once an architecture request created them."""
+        if scope["type"] not in ("http", "websocket"):
+            return
+
+        idx = scope.get("path_params", {}).get("session", DEFAULT_SESSION)
+        if idx == DEFAULT_SESSION:
+            session = self.get(idx)
+        elif SESSION_PATTERN.match(idx):
+            session = self.find(idx)
+        else:
+            session = None
+        if session is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+        await self.asgi(session)(scope, receive, send)
+
+    def queue_depths(self) -> List[Tuple[Tuple[str], int]]:
+        """Gradio events waiting to be processed, per session."""
+        depths = []
+        for session in list(self.sessions.values()):
+            queue = getattr(session.graph_app.io, "_queue", None)
+            depths.append(((session.id,), len(queue) if queue is not None else 0))
+        return depths
+
+
+def create_registry(factory: Callable[[], GraphApp]) -> SessionRegistry:
+    sessions = SessionRegistry(
+        factory,
+        max_size=int(os.getenv("SESSION_POOL_SIZE", 64)),
+        idle_timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", 3600)),
+        max_memory=int(os.getenv("SESSION_MAX_MEMORY_MB", 256)) * 2**20,
+    )
+    registry.gauge(
+        "llmflow_sessions",
+        "Sessions holding a pipeline.",
+        collect=lambda: [((), len(sessions))],
+    )
+    registry.gauge(
+        "llmflow_gradio_queue_depth",
+        "Gradio events waiting to be processed, per session.",
+        ("session",),
+        sessions.queue_depths,
+    )
+    return sessions
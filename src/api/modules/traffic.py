@@ -0,0 +1,303 @@
+import os
+import re
+import time
+import random
+import asyncio
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from api.modules.accounting import record_queue
+from middleware.logging_middleware import logger
+from middleware.metrics import registry
+from middleware.tracing import tracer
+
+RETRY_STATUS = (429, 502, 503, 504)
+STATUS_PATTERN = re.compile(r"status code (\d{3})")
+
+
+class BackendOverloaded(Exception):
+    """Raised when a backend cannot take a request, mapped to a 429 response."""
+
+    def __init__(self, message: str, retry_after: float = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def status_code(error: Exception) -> Optional[int]:
+    """HTTP status of a provider error, from the OpenAI and httpx exceptions or
+    the message Ollama raises."""
+    code = getattr(error, "status_code", None)
+    if code is None and getattr(error, "response", None) is not None:
+        code = getattr(error.response, "status_code", None)
+    if code is None:
+        match = STATUS_PATTERN.search(str(error))
+        code = int(match.group(1)) if match else None
+    return code
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills `per_minute` units a minute, bursting up to `per_minute`.
+
+    Requests larger than the bucket wait for a full bucket and drive it into
+    debt, so they are slowed down rather than rejected.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float) -> None:
+        while True:
+            self.refill()
+            if self.tokens >= min(amount, self.capacity):
+                self.tokens -= amount
+                return
+            await asyncio.sleep((min(amount, self.capacity) - self.tokens) / self.rate)
+
+    def charge(self, amount: float) -> None:
+        self.refill()
+        self.tokens -= amount
+
+
+class Backend:
+    """Limits of a single provider endpoint, API key and model."""
+
+    __slots__ = (
+        "name",
+        "semaphore",
+        "active",
+        "waiting",
+        "users",
+        "max_queue",
+        "requests",
+        "tokens",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        max_queue: int,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+    ):
+        self.name = name
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.users = 0
+        self.max_queue = max_queue
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+
+class TrafficController:
+    """Per-backend concurrency limits, rate limits and retries for LLM calls.
+
+    Each backend admits `concurrency` calls at once and queues at most
+    `max_queue` more for up to `queue_timeout` seconds, anything beyond is
+    rejected with BackendOverloaded instead of piling up. Optional token
+    buckets cap requests and (estimated) tokens per minute. Calls failing with
+    a rate limit or unavailable status before streaming anything are retried
+    with full-jitter exponential backoff, waiting at least as long as the
+    provider's Retry-After. At most `max_backends` backends are kept, the
+    least recently used ones without calls in progress are dropped first.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, Dict[str, float]],
+        max_retries: int = 4,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        queue_timeout: float = 60,
+        max_backends: int = 64,
+    ):
+        self.limits = limits
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue_timeout = queue_timeout
+        self.max_backends = max_backends
+        self.backends: OrderedDict[Tuple, Backend] = OrderedDict()
+        self.stats: Dict[str, int] = {"requests": 0, "retries": 0, "rejected": 0}
+
+    def backend(self, provider: str, *key: str) -> Backend:
+        key = (provider, *key)
+        backend = self.backends.get(key)
+        if backend is not None:
+            self.backends.move_to_end(key)
+            return backend
+
+        limits = self.limits[provider]
+        backend = self.backends[key] = Backend(
+            "/".join(key[:2]),
+            concurrency=int(limits["concurrency"]),
+            max_queue=int(limits["max_queue"]),
+            requests_per_minute=limits["requests_per_minute"],
+            tokens_per_minute=limits["tokens_per_minute"],
+        )
+        self.evict()
+        return backend
+
+    def evict(self) -> None:
+        # Backends with calls queued, streaming or backing off keep their
+        # limits, so the pool may briefly exceed its size.
+        for key in [key for key, backend in self.backends.items() if not backend.users]:
+            if len(self.backends) <= self.max_backends:
+                break
+            del self.backends[key]
+
+    def totals(self, attribute: str) -> List[Tuple[Tuple[str], int]]:
+        """Sum of a counter of the backends, per endpoint over keys and models."""
+        totals: Dict[str, int] = {}
+        for backend in list(self.backends.values()):
+            totals[backend.name] = totals.get(backend.name, 0) + getattr(
+                backend, attribute
+            )
+        return [((name,), total) for name, total in totals.items()]
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        return max(delay, retry_after(error) or 0)
+
+    async def admit(self, backend: Backend, tokens: float) -> None:
+        started = time.perf_counter()
+        try:
+            await self.wait(backend, tokens)
+        finally:
+            record_queue(time.perf_counter() - started)
+
+    async def wait(self, backend: Backend, tokens: float) -> None:
+        if not backend.semaphore.locked():
+            await backend.semaphore.acquire()
+        elif backend.waiting >= backend.max_queue:
+            self.stats["rejected"] += 1
+            raise BackendOverloaded(f"Too many queued requests for {backend.name}")
+        else:
+            backend.waiting += 1
+            try:
+                await asyncio.wait_for(backend.semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["rejected"] += 1
+                raise BackendOverloaded(f"Timed out waiting for {backend.name}")
+            finally:
+                backend.waiting -= 1
+
+        try:
+            if backend.requests is not None:
+                await backend.requests.acquire(1)
+            if backend.tokens is not None:
+                await backend.tokens.acquire(tokens)
+        except BaseException:
+            backend.semaphore.release()
+            raise
+
+    async def stream(
+        self,
+        backend: Backend,
+        factory: Callable[[], AsyncIterator[str]],
+        prompt_tokens: float = 0,
+    ) -> AsyncIterator[str]:
+        """Stream a provider call once the backend admits it, retrying it while
+        nothing has been streamed yet."""
+        self.stats["requests"] += 1
+        backend.users += 1
+        try:
+            with tracer.span("llm.call", backend=backend.name):
+                attempt = 0
+                while True:
+                    with tracer.span("llm.queue", waiting=backend.waiting):
+                        await self.admit(backend, prompt_tokens)
+                    backend.active += 1
+                    streamed = 0
+                    try:
+                        with tracer.span("llm.attempt", attempt=attempt):
+                            async for chunk in factory():
+                                streamed += len(chunk)
+                                yield chunk
+                        return
+                    except Exception as e:
+                        code = status_code(e)
+                        if streamed or code not in RETRY_STATUS:
+                            raise
+                        if attempt >= self.max_retries:
+                            # Only rate limiting is reported as an overloaded
+                            # backend, an unavailable provider fails as it is.
+                            if code != 429:
+                                raise
+                            self.stats["rejected"] += 1
+                            raise BackendOverloaded(
+                                f"{backend.name} is rate limited", retry_after(e) or 1
+                            ) from e
+                        delay = self.delay(attempt, e)
+                    finally:
+                        backend.active -= 1
+                        backend.semaphore.release()
+                        if backend.tokens is not None and streamed:
+                            backend.tokens.charge(streamed / 4)
+
+                    attempt += 1
+                    self.stats["retries"] += 1
+                    logger.warning(
+                        f"Model | {backend.name} returned {code}, retrying in {delay:.2f}s"
+                    )
+                    with tracer.span("llm.backoff", status=code, delay=delay):
+                        await asyncio.sleep(delay)
+        finally:
+            backend.users -= 1
+
+
+def limits(provider: str, concurrency: int) -> Dict[str, float]:
+    prefix = provider.upper()
+    return {
+        "concurrency": int(os.getenv(f"{prefix}_MAX_CONCURRENCY", concurrency)),
+        "max_queue": int(os.getenv(f"{prefix}_MAX_QUEUE", 64)),
+        "requests_per_minute": float(os.getenv(f"{prefix}_REQUESTS_PER_MINUTE", 0)),
+        "tokens_per_minute": float(os.getenv(f"{prefix}_TOKENS_PER_MINUTE", 0)),
+    }
+
+
+traffic = TrafficController(
+    {"openai": limits("openai", 16), "ollama": limits("ollama", 2)},
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", 4)),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", 60)),
+    max_backends=int(os.getenv("CLIENT_POOL_SIZE", 64)),
+)
+
+registry.gauge(
+    "llmflow_llm_in_flight",
+    "LLM calls currently streaming, per backend.",
+    ("backend",),
+    lambda: traffic.totals("active"),
+)
+registry.gauge(
+    "llmflow_llm_queued",
+    "LLM calls waiting for a backend to admit them.",
+    ("backend",),
+    lambda: traffic.totals("waiting"),
+)
+registry.counter(
+    "llmflow_llm_requests_total",
+    "LLM calls by outcome: requests made, retries and rejections.",
+    ("result",),
+    lambda: [((result,), count) for result, count in traffic.stats.items()],
+)
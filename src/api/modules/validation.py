@@ -0,0 +1,163 @@
+from array import array
+from collections import deque
+from pydantic import BaseModel
+from typing import Dict, List
+
+from api.modules.runtime import RuntimeGraph
+
+
+class Diagnostic(BaseModel):
+    """A single problem found while validating an architecture."""
+
+    level: str
+    code: str
+    message: str
+    nodes: List[int] = []
+
+
+class UnionFind:
+    """UnionFind data structure with iterative path halving."""
+
+    __slots__ = ("parent", "rank")
+
+    def __init__(self, n: int):
+        self.parent = array("l", range(n))
+        self.rank = array("l", [0]) * n
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def find(self, u: int) -> int:
+        parent = self.parent
+        while parent[u] != u:
+            parent[u] = parent[parent[u]]
+            u = parent[u]
+        return u
+
+    def union(self, u: int, v: int) -> bool:
+        root_u = self.find(u)
+        root_v = self.find(v)
+        if root_u == root_v:
+            return False
+
+        if self.rank[root_u] < self.rank[root_v]:
+            root_u, root_v = root_v, root_u
+        self.parent[root_v] = root_u
+        if self.rank[root_u] == self.rank[root_v]:
+            self.rank[root_u] += 1
+        return True
+
+
+class GraphValidator:
+    """Validation engine owned by a single RuntimeGraph.
+
+    Every check is iterative and linear in the size of the graph, and all of
+    its state lives on the validator, so nothing is shared between rebuilds.
+    """
+
+    def __init__(self, graph: RuntimeGraph):
+        self.graph = graph
+        self.uf = UnionFind(len(graph.nodes))
+
+    def validate(self) -> List[Diagnostic]:
+        return self.cycles() + self.components() + self.unconnected()
+
+    def cycles(self) -> List[Diagnostic]:
+        """Find the nodes on cycles which do not pass through a chat or input node.
+
+        Kahn's algorithm removes every node which is not downstream of a cycle,
+        then the same pass run backwards removes every node which is only
+        downstream of one, leaving the nodes on or between cycles.
+        """
+        graph = self.graph
+        size = len(graph.nodes)
+        computed = {
+            slot
+            for slot, node in enumerate(graph.nodes)
+            if node.kind not in ("chat", "input")
+        }
+        indegree = array("l", [0]) * size
+        outdegree = array("l", [0]) * size
+        dependents: Dict[int, List[int]] = {}
+        for slot in computed:
+            for source in graph.requirements(slot):
+                indegree[slot] += 1
+                outdegree[source] += 1
+                dependents.setdefault(source, []).append(slot)
+
+        remaining = set(range(size))
+        queue = deque(slot for slot in range(size) if indegree[slot] == 0)
+        while queue:
+            slot = queue.popleft()
+            remaining.discard(slot)
+            for target in dependents.get(slot, ()):
+                indegree[target] -= 1
+                if indegree[target] == 0:
+                    queue.append(target)
+
+        if not remaining:
+            return []
+
+        queue = deque(slot for slot in remaining if outdegree[slot] == 0)
+        while queue:
+            slot = queue.popleft()
+            remaining.discard(slot)
+            if slot not in computed:
+                continue
+            for source in graph.requirements(slot):
+                outdegree[source] -= 1
+                if outdegree[source] == 0 and source in remaining:
+                    queue.append(source)
+
+        return [
+            Diagnostic(
+                level="error",
+                code="cycle",
+                message="Architecture contains a cycle that does not pass through a chat node",
+                nodes=sorted(graph.nodes[slot].idx for slot in remaining),
+            )
+        ]
+
+    def components(self) -> List[Diagnostic]:
+        """Report every connected component apart from the largest one."""
+        graph = self.graph
+        for slot in range(len(graph.nodes)):
+            for source in graph.requirements(slot):
+                self.uf.union(slot, source)
+
+        groups: Dict[int, List[int]] = {}
+        for slot, node in enumerate(graph.nodes):
+            groups.setdefault(self.uf.find(slot), []).append(node.idx)
+        if len(groups) <= 1:
+            return []
+
+        largest = max(groups.values(), key=len)
+        return [
+            Diagnostic(
+                level="warning",
+                code="disconnected",
+                message="Nodes are not connected to the rest of the architecture",
+                nodes=sorted(group),
+            )
+            for group in groups.values()
+            if group is not largest
+        ]
+
+    def unconnected(self) -> List[Diagnostic]:
+        """Report output nodes which nothing feeds into."""
+        nodes = [
+            node.idx
+            for slot, node in enumerate(self.graph.nodes)
+            if node.kind == "output" and not len(self.graph.sources(slot))
+        ]
+        if not nodes:
+            return []
+
+        return [
+            Diagnostic(
+                level="warning",
+                code="unconnected_output",
+                message="Output nodes have no input connected",
+                nodes=nodes,
+            )
+        ]
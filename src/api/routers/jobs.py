@@ -0,0 +1,112 @@
+from pydantic import ValidationError
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+
+from ..api import jobs, compiled_app
+from ..modules.modules import RunContract, JobCreated, JobStatus
+from ..modules.sessions import session_id
+
+router = APIRouter()
+
+
+def architecture(session: str):
+    return compiled_app(session).stored_json
+
+
+@router.post(
+    "",
+    summary="Queue a single run of the current architecture",
+    response_description="Return the id of the queued job",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=JobCreated,
+)
+async def create_job(contract: RunContract, session: str = Depends(session_id)):
+    jobs.start()
+    job = await jobs.submit(
+        session,
+        architecture(session),
+        [{"inputs": contract.inputs, "history": contract.history}],
+    )
+    return JobCreated(id=job, total=1)
+
+
+@router.post(
+    "/batch",
+    summary="Queue a JSONL batch of runs of the current architecture",
+    response_description="Return the id of the queued job",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=JobCreated,
+)
+async def create_batch(request: Request, session: str = Depends(session_id)):
+    """
+    ## Queue a batch of runs
+    The request body is JSONL, one `{"inputs": {...}, "history": [...]}` object
+    per line. Every line is run against a snapshot of the current architecture.
+    """
+    items = []
+    async for line in lines(request):
+        try:
+            contract = RunContract.model_validate_json(line)
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Line {len(items) + 1} is not a valid run: {describe(e)}",
+            )
+        items.append({"inputs": contract.inputs, "history": contract.history})
+    if not items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="The batch is empty"
+        )
+
+    jobs.start()
+    job = await jobs.submit(session, architecture(session), items)
+    return JobCreated(id=job, total=len(items))
+
+
+def describe(error: ValidationError) -> str:
+    return "; ".join(
+        (
+            ".".join(str(part) for part in item["loc"]) + ": " + item["msg"]
+            if item["loc"]
+            else item["msg"]
+        )
+        for item in error.errors()
+    )
+
+
+async def lines(request: Request):
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+@router.get(
+    "/{job}",
+    summary="Get the progress of a job",
+    response_description="Return the item counts of the job",
+    response_model=JobStatus,
+)
+async def get_job(job: str):
+    progress = await jobs.status(job)
+    if progress is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such job")
+    return JobStatus(**progress)
+
+
+@router.get(
+    "/{job}/results",
+    summary="Stream the results of a job",
+    response_description="Return one NDJSON line per finished item, in input order",
+)
+async def get_job_results(job: str, follow: bool = True):
+    if await jobs.status(job) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No such job")
+    return StreamingResponse(
+        jobs.results(job, follow), media_type="application/x-ndjson"
+    )
@@ -5,9 +5,11 @@ from ..modules.modules import (
     DropdownItem,
     Node,
     SliderItem,
+    NumberItem,
     TextDisplay,
     HandleElement,
     TextAreaItem,
+    CheckboxItem,
     Node,
 )
 
@@ -74,6 +76,17 @@ async def get_openai():
                 hasHandle=True,
                 handleStyle={"top": 174},
             ),
+            CheckboxItem(
+                label="Cache Responses",
+                options={"labels": ["True"], "states": [False]},
+            ),
+            NumberItem(
+                label="History Tokens",
+                min=0,
+                max=128000,
+                step=256,
+                initial=2048,
+            ),
             TextDisplay(label="Output"),
             HandleElement(
                 label="OpenAI",
@@ -168,6 +181,17 @@ async def get_ollama():
                 hasHandle=True,
                 handleStyle={"top": 210},
             ),
+            CheckboxItem(
+                label="Cache Responses",
+                options={"labels": ["True"], "states": [False]},
+            ),
+            NumberItem(
+                label="History Tokens",
+                min=0,
+                max=128000,
+                step=256,
+                initial=2048,
+            ),
             TextDisplay(label="Output"),
             HandleElement(
                 label="Ollama",
@@ -0,0 +1,107 @@
+"""Benchmark building, validating and compiling large architectures.
+
+Run from the project root with `pipenv run bench-compile [--sizes 1000 10000]`.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.modules.runtime import RuntimeGraph
+from api.modules.nodes import node_types
+from api.modules.validation import GraphValidator
+
+
+def item(label, value):
+    return {"Type": label, "Value": value}
+
+
+def architecture(size: int):
+    """Lanes of Text Input -> System Prompt -> LLM -> Text Output, with a prompt
+    input overriding each System Prompt and every LLM also feeding the output of
+    the next lane."""
+    nodes = []
+    edges = []
+    for lane in range(size // 5):
+        base = lane * 5 + 1
+        nodes += [
+            {"Id": base, "Name": "Text Input", "Items": [item("Label", "")]},
+            {"Id": base + 1, "Name": "Text Input", "Items": [item("Label", "")]},
+            {"Id": base + 2, "Name": "System Prompt", "Items": [item("Prompt", "")]},
+            {"Id": base + 3, "Name": "OpenAI LLM", "Items": [item("Model", "")]},
+            {"Id": base + 4, "Name": "Text Output", "Items": [item("Label", "")]},
+        ]
+        edges += [
+            {"Source": base, "Target": base + 2, "Type": "Normal"},
+            {"Source": base + 2, "Target": base + 3, "Type": "Normal"},
+            {"Source": base + 3, "Target": base + 4, "Type": "Normal"},
+            {
+                "Source": base + 1,
+                "Target": base + 2,
+                "Type": "Data",
+                "Target Handle": "element_1",
+            },
+        ]
+        if lane:
+            edges.append({"Source": base - 2, "Target": base + 4, "Type": "Normal"})
+
+    return {"Nodes": nodes, "Edges": edges}
+
+
+def build(request_model):
+    return RuntimeGraph.from_architecture(request_model, node_types.get)
+
+
+def measure(size: int, repeat: int = 3):
+    """Best-of-`repeat` timings, then a separate traced pass for memory since
+    tracemalloc slows allocation down considerably."""
+    request_model = architecture(size)
+    build_times = []
+    validate_times = []
+    compile_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        graph = build(request_model)
+        built = time.perf_counter()
+        GraphValidator(graph).validate()
+        validated = time.perf_counter()
+        plan = graph.compile()
+        compile_times.append(time.perf_counter() - validated)
+        validate_times.append(validated - built)
+        build_times.append(built - start)
+
+    del graph, plan
+    tracemalloc.start()
+    plan = build(request_model).compile()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "nodes": len(request_model["Nodes"]),
+        "edges": len(request_model["Edges"]),
+        "build_ms": min(build_times) * 1000,
+        "validate_ms": min(validate_times) * 1000,
+        "compile_ms": min(compile_times) * 1000,
+        "retained_mb": retained / 2**20,
+        "peak_mb": peak / 2**20,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    sizes = parser.parse_args().sizes
+
+    print(
+        f"{'nodes':>8} {'edges':>8} {'build ms':>10} {'validate ms':>12} {'compile ms':>11} {'retained MB':>12} {'peak MB':>8}"
+    )
+    for size in sizes:
+        result = measure(size)
+        print(
+            f"{result['nodes']:>8} {result['edges']:>8} {result['build_ms']:>10.1f} "
+            f"{result['validate_ms']:>12.1f} {result['compile_ms']:>11.1f} {result['retained_mb']:>12.2f} {result['peak_mb']:>8.2f}"
+        )
@@ -0,0 +1,138 @@
+"""Stress concurrent runs of one architecture whose LLM settings are set by
+data edges, checking every run only sees its own API key, model and
+temperature and that the compiled plan is never modified.
+
+Run from the project root with `pipenv run stress-runs [--runs 2000]`, the
+exit status is 1 when a run saw another run's values.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.modules.graph import GraphApp
+from api.modules.runtime import RuntimeGraph
+from api.modules.configs import OpenAIConfig
+from api.modules.nodes import NodeType, node_types
+from api.modules import handlers
+
+
+async def echo_llm(data, config: OpenAIConfig):
+    """Stands in for an LLM, yielding to other runs before reporting the
+    settings it was called with."""
+    await asyncio.sleep(random.random() / 1000)
+    return f"{config.api_key}|{config.model}|{config.temperature}|{data}"
+
+
+def item(label, value):
+    return {"Type": label, "Value": value}
+
+
+def architecture(lanes: int):
+    """Lanes of prompt, key, model and temperature inputs feeding an echo LLM
+    through one normal and three data edges, then a Text Output."""
+    nodes = []
+    edges = []
+    for lane in range(lanes):
+        base = lane * 6 + 1
+        nodes += [
+            {"Id": base + i, "Name": "Text Input", "Items": [item("Label", "")]}
+            for i in range(4)
+        ]
+        nodes += [
+            {
+                "Id": base + 4,
+                "Name": "Echo LLM",
+                "Items": [
+                    item("Model", "default"),
+                    item("Temperature", 0.7),
+                    item("API Key", "default"),
+                ],
+            },
+            {"Id": base + 5, "Name": "Text Output", "Items": [item("Label", "")]},
+        ]
+        edges += [
+            {"Source": base, "Target": base + 4, "Type": "Normal"},
+            {"Source": base + 4, "Target": base + 5, "Type": "Normal"},
+        ]
+        for source, handle in ((1, "element_2"), (2, "element_3"), (3, "element_4")):
+            edges.append(
+                {
+                    "Source": base + source,
+                    "Target": base + 4,
+                    "Type": "Data",
+                    "Target Handle": handle,
+                }
+            )
+    return {"Nodes": nodes, "Edges": edges}
+
+
+async def stress(runs: int, lanes: int, concurrency: int):
+    graph_app = GraphApp(io=None)
+    graph_app.plan = RuntimeGraph.from_architecture(
+        architecture(lanes), node_types.get
+    ).compile()
+    before = [[dict(arg) for arg in step.args] for step in graph_app.plan.steps]
+    outputs = graph_app.plan.outputs
+    limit = asyncio.Semaphore(concurrency)
+    leaks = []
+
+    async def run(number: int):
+        # Every fourth run repeats an earlier one, so memoized results are
+        # reused across runs too.
+        seed = number - number % 4 if number % 4 == 3 else number
+        args = []
+        for lane in range(lanes):
+            args += [f"prompt-{seed}-{lane}", f"key-{seed}", f"model-{seed}"]
+            args.append(round(seed % 100 / 100, 2))
+        async with limit:
+            values = await graph_app.run_plan(tuple(args), max_parallelism=lanes)
+        for lane, slot in enumerate(outputs):
+            expected = f"key-{seed}|model-{seed}|{round(seed % 100 / 100, 2)}|prompt-{seed}-{lane}"
+            if values[slot] != expected:
+                leaks.append((number, values[slot], expected))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(number) for number in range(runs)))
+    elapsed = time.perf_counter() - start
+    after = [[dict(arg) for arg in step.args] for step in graph_app.plan.steps]
+    return elapsed, leaks, before == after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--lanes", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    node_types.register(
+        NodeType(
+            name="Echo LLM",
+            handler=handlers.handle_llm,
+            config=OpenAIConfig,
+            executor=echo_llm,
+            overrides=node_types.types["OpenAI LLM"].overrides,
+        )
+    )
+
+    elapsed, leaks, unchanged = asyncio.run(
+        stress(args.runs, args.lanes, args.concurrency)
+    )
+    print(
+        f"{args.runs} runs of {args.lanes} lanes, {args.concurrency} concurrent: "
+        f"{elapsed:.2f}s ({args.runs / elapsed:.0f} runs/s)"
+    )
+    print(f"runs seeing other runs' values: {len(leaks)}")
+    for number, value, expected in leaks[:5]:
+        print(f"  run {number}: {value!r}, expected {expected!r}")
+    print(f"plan unchanged: {unchanged}")
+    if leaks or not unchanged:
+        sys.exit(1)
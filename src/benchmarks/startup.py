@@ -0,0 +1,107 @@
+"""Benchmark the startup of the API: import time by module and the time until a
+freshly started server answers the health check.
+
+Run from the project root with `pipenv run bench-startup [--budget 2]`, the
+exit status is 1 when the median time to healthy exceeds the budget.
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def environment():
+    return {**os.environ, "PYTHONPATH": os.path.join(ROOT, "src")}
+
+
+def import_times(module: str = "main"):
+    """Self and cumulative import time in ms and nesting depth of every module
+    imported by `module`, from `python -X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=environment(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), int(own) / 1000, int(cumulative) / 1000, depth))
+    return times
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_healthy(timeout: float = 60) -> float:
+    """Seconds from spawning uvicorn until `GET /` returns 200."""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--app-dir", "src", "main:app"]
+        + ["--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=environment(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"The server exited with {server.returncode}")
+            try:
+                with urllib.request.urlopen(
+                    f"http://127.0.0.1:{port}/", timeout=1
+                ) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"The server was not healthy after {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=None)
+    args = parser.parse_args()
+
+    times = import_times()
+    total = next(cumulative for name, _, cumulative, _ in times if name == "main")
+    print(f"import main: {total:.0f} ms")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    shallow = [entry for entry in times if entry[3] <= args.depth]
+    for name, own, cumulative, depth in sorted(shallow, key=lambda t: -t[2])[
+        : args.top
+    ]:
+        print(f"{cumulative:>14.1f} {own:>8.1f}  {'  ' * depth}{name}")
+
+    runs = [time_to_healthy() for _ in range(args.repeat)]
+    healthy = statistics.median(runs)
+    print(
+        f"\ntime to healthy: {healthy:.2f}s median of {args.repeat} "
+        f"({', '.join(f'{run:.2f}s' for run in runs)})"
+    )
+    if args.budget is not None and healthy > args.budget:
+        print(f"over the startup budget of {args.budget:.2f}s")
+        sys.exit(1)
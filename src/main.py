@@ -1,15 +1,20 @@
+import os
 import traceback
-import gradio as gr
 from fastapi import FastAPI, status, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
 
 from version import __version__
 from api.modules.modules import *
-from api.api import graph_app
+from api.api import sessions, jobs, catalog
+from api.modules.lazy import preload
+from api.modules.conversation import token_counter
+from api.modules.traffic import BackendOverloaded
 from api.api import router as api_router
 from middleware.logging_middleware import logger, LoggingMiddleware
+from middleware.metrics import registry, MetricsMiddleware
+from middleware.tracing import TracingMiddleware
 
 DESC = """
 LLMFlow is a no-code solution to quickly build and test your own language model pipelines. \\
@@ -30,6 +35,18 @@ app.add_middleware(
 )
 
 app.add_middleware(LoggingMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
+
+@app.exception_handler(BackendOverloaded)
+async def overloaded_exception_handler(request: Request, exc: BackendOverloaded):
+    logger.warning(f"API | {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"message": "The LLM provider is overloaded.", "detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
 
 
 @app.exception_handler(Exception)
@@ -42,6 +59,32 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
+@app.on_event("startup")
+async def start_jobs():
+    jobs.start()
+
+
+@app.on_event("startup")
+async def build_catalog():
+    await catalog.build(app.routes, API, f"{API}/catalog")
+
+
+@app.on_event("startup")
+async def preload_modules():
+    names = os.getenv("PRELOAD_MODULES", "gradio,api.models.openai,api.models.ollama")
+    preload([name.strip() for name in names.split(",") if name.strip()])
+
+
+@app.on_event("startup")
+async def load_tokenizer():
+    token_counter.load()
+
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    await jobs.stop()
+
+
 @app.get(
     "/",
     summary="Perform a Health Check",
@@ -63,7 +106,27 @@ def get_health() -> HealthCheck:
     return HealthCheck(status="OK")
 
 
-graph_app.render_elements()
+@app.get(
+    "/metrics",
+    summary="Export Metrics",
+    response_description="Return the metrics in the Prometheus text format",
+    response_class=PlainTextResponse,
+)
+def get_metrics() -> PlainTextResponse:
+    """
+    ## Export Metrics
+    Endpoint scraped by Prometheus: request latency per route, node execution
+    time per node type, in-flight LLM calls per backend, Gradio queue depth and
+    cache hit ratios.
+    """
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 
-app = gr.mount_gradio_app(app, graph_app.io, path="/gradio")
+# Session interfaces are mounted before the default one, which would
+# otherwise match every path under /gradio. Both are built, and Gradio is
+# imported, on their first request.
+app.mount("/gradio/sessions/{session}", sessions)
+app.mount("/gradio", sessions)
 app.include_router(api_router, prefix=API)
@@ -1,31 +1,99 @@
 import os
 import time
+import queue
+import atexit
 import logging
-from fastapi import Request
-from starlette.routing import Match
-from starlette.middleware.base import BaseHTTPMiddleware
+import logging.config
+import logging.handlers
+from typing import Any, Callable, Dict, Optional
+
+from middleware.structured_logging import (
+    DeferredQueueHandler,
+    Payload,
+    RunFilter,
+    Secret,
+    sample_run,
+    sampled,
+)
+
+
+def enqueue_handlers(
+    logger: logging.Logger,
+) -> Optional[logging.handlers.QueueListener]:
+    """Move the handlers of a logger behind a queue, so records are written by a
+    background thread instead of the caller."""
+    handlers = logger.handlers[:]
+    if not handlers:
+        return None
+
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(RunFilter())
+    for existing in handlers:
+        logger.removeHandler(existing)
+    logger.addHandler(handler)
+
+    listener = logging.handlers.QueueListener(
+        records, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
 
 if os.getenv("LOGS", "console") == "file":
+    os.makedirs("logs", exist_ok=True)
     logging.config.fileConfig("config/file.conf")
 else:
     logging.config.fileConfig("config/console.conf")
 
 logger = logging.getLogger("appLogger")
+listener = enqueue_handlers(logging.getLogger())
+
+
+def route_title(endpoint: Callable) -> str:
+    return str(endpoint.__name__).replace("_", " ").title()
+
+
+class LoggingMiddleware:
+    """ASGI middleware logging the time taken by every API endpoint.
+
+    The router records the endpoint it matched in the request scope, so the
+    display name is looked up in a table of the app's own endpoints, built
+    once, instead of matching every route again. Requests served by mounted
+    apps such as Gradio, and websockets, pass straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.names: Dict[Callable, str] = {}
+        self.routes = -1
+
+    def name(self, app: Any, endpoint: Callable) -> str:
+        # Routes can still be added after the middleware is created, so the
+        # table is rebuilt whenever their number changes.
+        routes = getattr(app, "routes", ())
+        if len(routes) != self.routes:
+            self.names = {
+                route.endpoint: route_title(route.endpoint)
+                for route in routes
+                if hasattr(route, "endpoint")
+            }
+            self.routes = len(routes)
+        return self.names.get(endpoint, "")
 
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        name = ""
-        for route in request.app.routes:
-            if hasattr(route, "endpoint"):
-                match, scope = route.matches(request.scope)
-                if match == Match.FULL:
-                    name = str(route.endpoint.__name__).replace("_", " ").title()
-                    break  # Exit the loop once a match is found
-
-        start_time = time.time()
-        response = await call_next(request)
-        duration = time.time() - start_time
-        if name != "":
-            logger.info(f"API | {name} | {duration:.3f}s")
-        return response
+        app = scope.get("app")
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            endpoint = scope.get("endpoint")
+            name = self.name(app, endpoint) if endpoint is not None else ""
+            if name != "":
+                duration = time.perf_counter() - start_time
+                logger.info(f"API | {name} | {duration:.3f}s")
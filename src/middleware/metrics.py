@@ -0,0 +1,245 @@
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Samples = Iterable[Tuple[Sequence[str], float]]
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def hit_ratio(hits: float, misses: float) -> float:
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+class Metric:
+    """A counter or gauge, either updated in place or read from `collect` at
+    scrape time."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Samples]] = None,
+    ):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def samples(self) -> Samples:
+        if self.collect is not None:
+            return list(self.collect())
+        with self.lock:
+            return list(self.values.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in self.samples():
+            lines.append(
+                f"{self.name}{format_labels(self.labels, values)} {format_value(value)}"
+            )
+        return lines
+
+
+class Histogram(Metric):
+    """Cumulative histogram of observations, one set of buckets per label set."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, "histogram", labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                # One count per bucket, then +Inf, the sum and the count.
+                series = self.series[key] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels: str) -> "Timer":
+        return Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        for key, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}"
+                )
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(values[-2])}")
+            lines.append(f"{self.name}_count{labels} {values[-1]}")
+        return lines
+
+
+class Timer:
+    """Context manager observing the time spent in its block."""
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    """In-process metrics registry rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Samples]] = None,
+    ) -> Metric:
+        return self.register(Metric(name, help, "counter", labels, collect))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Samples]] = None,
+    ) -> Metric:
+        return self.register(Metric(name, help, "gauge", labels, collect))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "llmflow_http_request_duration_seconds",
+    "Latency of HTTP requests by route.",
+    ("method", "route", "status"),
+)
+requests_in_flight = registry.gauge(
+    "llmflow_http_requests_in_flight", "HTTP requests currently being served."
+)
+
+
+def route_name(scope) -> str:
+    """Route template of a request, so ids in paths do not explode the label
+    cardinality."""
+    # Routes of the mounted Gradio apps are relative to their mount, and
+    # session mounts carry the session id, so they are reported as one route.
+    if scope.get("path", "").startswith("/gradio"):
+        return "/gradio"
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            requests_in_flight.dec()
+            request_duration.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route_name(scope),
+                status=str(status[0]),
+            )
@@ -0,0 +1,110 @@
+import os
+import json
+import random
+import hashlib
+import reprlib
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from typing import Any, Tuple
+
+PAYLOAD_CHARS = int(os.getenv("LOG_PAYLOAD_CHARS", 256))
+SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1))
+
+# The id of the run being executed and whether its node details are logged.
+current_run: ContextVar[Tuple[str, bool]] = ContextVar(
+    "current_run", default=("", True)
+)
+
+
+def sample_run() -> None:
+    """Start logging a run in the current context, deciding once whether the
+    payloads of its nodes are logged."""
+    current_run.set((os.urandom(6).hex(), random.random() < SAMPLE_RATE))
+
+
+def sampled() -> bool:
+    return current_run.get()[1]
+
+
+payload_repr = reprlib.Repr()
+payload_repr.maxstring = payload_repr.maxother = PAYLOAD_CHARS
+payload_repr.maxlist = payload_repr.maxtuple = payload_repr.maxdeque = 16
+payload_repr.maxdict = payload_repr.maxset = payload_repr.maxfrozenset = 16
+
+
+class Payload:
+    """A value to log, only rendered if the record is emitted, and then cut to
+    `LOG_PAYLOAD_CHARS` characters next to its length. Containers are rendered
+    with a bounded repr, so their full repr is never built.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        value = self.value
+        if isinstance(value, str):
+            if len(value) <= PAYLOAD_CHARS:
+                return value
+            return f"{value[:PAYLOAD_CHARS]}... ({len(value)} chars)"
+
+        try:
+            text = payload_repr.repr(value)
+        except RuntimeError:
+            # Records are rendered by the logging thread, the value may have
+            # been changed by its owner in the meantime.
+            return f"<{type(value).__name__} changed while logging>"
+        if len(text) <= PAYLOAD_CHARS:
+            return text
+        if isinstance(value, (list, tuple, dict, set)):
+            return f"{text[:PAYLOAD_CHARS]}... ({len(value)} items)"
+        return f"{text[:PAYLOAD_CHARS]}..."
+
+
+class Secret:
+    """A secret to log, rendered as a short digest so it can be told apart
+    from other values without being written out."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        digest = hashlib.sha256(str(self.value).encode()).hexdigest()[:12]
+        return f"<secret sha256:{digest}>"
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records as they are, so their message and payloads are rendered
+    by the listener thread instead of the caller."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RunFilter(logging.Filter):
+    """Tag records with the run they were logged in."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run = current_run.get()[0]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "run", ""):
+            entry["run"] = record.run
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
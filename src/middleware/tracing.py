@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import threading
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from middleware.metrics import route_name
+from middleware.logging_middleware import logger
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    """A timed operation of a trace, the current span of a context while it is
+    entered."""
+
+    __slots__ = (
+        "tracer",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "attributes",
+        "status",
+        "start",
+        "started",
+        "duration",
+        "token",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any],
+    ):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = 0
+        self.started = 0
+        self.duration = 0
+        self.token = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def __enter__(self) -> "Span":
+        self.start = time.time_ns()
+        self.started = time.perf_counter_ns()
+        self.token = current_span.set(self)
+        return self
+
+    def __exit__(self, kind, error, traceback) -> None:
+        self.duration = time.perf_counter_ns() - self.started
+        if error is not None:
+            self.status = "error"
+            self.attributes["error"] = f"{kind.__name__}: {error}"
+        try:
+            current_span.reset(self.token)
+        except ValueError:
+            # Exited in another context, as async generators closed by the
+            # garbage collector are.
+            pass
+        self.tracer.export(self)
+
+    def record(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start / 1e9,
+            "duration_ms": self.duration / 1e6,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class NoSpan:
+    """The span handed out while tracing is disabled."""
+
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "NoSpan":
+        return self
+
+    def __exit__(self, kind, error, traceback) -> None:
+        pass
+
+
+NO_SPAN = NoSpan()
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class SpanExporter(ABC):
+    """Receives every finished span. Exporters are called on the thread ending
+    the span, so they should hand the work off rather than block."""
+
+    @abstractmethod
+    def export(self, span: Span) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonLinesExporter(SpanExporter):
+    """Append spans as JSON lines to a file, written by a background thread."""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.spans: queue.SimpleQueue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.write, daemon=True)
+        self.thread.start()
+
+    def export(self, span: Span) -> None:
+        self.spans.put(span.record())
+
+    def write(self) -> None:
+        with open(self.path, "a") as file:
+            while (record := self.spans.get()) is not None:
+                file.write(json.dumps(record, default=str) + "\n")
+                if self.spans.empty():
+                    file.flush()
+
+    def shutdown(self) -> None:
+        self.spans.put(None)
+        self.thread.join(timeout=5)
+
+
+class LogExporter(SpanExporter):
+    """Log spans through the application logger."""
+
+    def export(self, span: Span) -> None:
+        logger.info(
+            "Trace | %s %s %.3fms (trace %s, span %s, parent %s)",
+            span.name,
+            span.status,
+            span.duration / 1e6,
+            span.trace_id,
+            span.span_id,
+            span.parent_id,
+        )
+
+
+EXPORTERS: Dict[str, Callable[[], SpanExporter]] = {
+    "jsonl": lambda: JsonLinesExporter(os.getenv("TRACE_FILE", "logs/traces.jsonl")),
+    "log": LogExporter,
+}
+
+
+class Tracer:
+    """Creates spans and hands the finished ones to the exporters. Without an
+    exporter every span is a no-op."""
+
+    def __init__(self, exporters: Optional[List[SpanExporter]] = None):
+        self.exporters = exporters or []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def add_exporter(self, exporter: SpanExporter) -> None:
+        self.exporters.append(exporter)
+
+    def span(self, name: str, **attributes: Any) -> Any:
+        """A child of the current span, or the root of a new trace."""
+        if not self.exporters:
+            return NO_SPAN
+        parent = current_span.get()
+        if parent is None:
+            return Span(self, name, os.urandom(16).hex(), None, attributes)
+        return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+    def remote_span(self, name: str, traceparent: str, **attributes: Any) -> Any:
+        """A span continuing the trace of a W3C `traceparent` header, or the root
+        of a new trace if the header is missing or invalid."""
+        match = TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+        if not self.exporters or match is None:
+            return self.span(name, **attributes)
+        return Span(self, name, match.group(1), match.group(2), attributes)
+
+    def export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    def shutdown(self) -> None:
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+def create_tracer() -> Tracer:
+    names = [name for name in os.getenv("TRACE_EXPORTER", "").split(",") if name]
+    tracer = Tracer([EXPORTERS[name.strip()]() for name in names])
+    atexit.register(tracer.shutdown)
+    return tracer
+
+
+tracer = create_tracer()
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a span for every HTTP request, continuing the
+    trace of its `traceparent` header and returning its own."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = ""
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        with tracer.remote_span(
+            f"{scope['method']} {scope['path']}", traceparent
+        ) as span:
+
+            async def send_traceparent(message):
+                if message["type"] == "http.response.start":
+                    span.set(status=message["status"])
+                    headers = list(message.get("headers", []))
+                    headers.append((b"traceparent", span.traceparent().encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_traceparent)
+            span.set(route=route_name(scope))